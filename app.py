@@ -1,437 +1,566 @@
 import datetime
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
 import streamlit as st
-import pandas as pd
 import pydeck as pdk
 import altair as alt
 
-def apply_color_payment(row):
-    colors = {
-        "Cash": "#e81416",
-        "Credit Card": "#ffa500",
-        "Dispute": "#faeb36",
-        "Mobile": "#79c314",
-        "No Charge": "#487de7",
-        "Prcard": "#4b369d",
-        "Unknown": "#70369d",
-    }
+from backends import DuckDBBackend, PandasBackend
+from cache import load_cached_cube, load_cached_trips
+from cube import mean
+from ingest import ingest_trips
+from parallel import compute_in_order
+from profiling import Profiler
+from sampling import StratifiedSampler
+from spatial import CELL_SHAPES, cell_size_for_zoom
+from trips import PAYMENT_COLORS, WEEKDAY_COLORS
 
-    return colors[row["Payment Type"]]
+# Either a URL or a local path, so the dashboard also works offline
+TRIPS_SOURCE = os.environ.get("TAXI_TRIPS_SOURCE", "https://www.dropbox.com/scl/fi/ftt2wzhzpjbemcovcayl0/taxi-trips.csv?rlkey=sxyqqsdmoug4mhpb1raiiugws&st=zy6h9ru0&dl=1")
+TRIPS_CACHE_DIR = os.environ.get("TAXI_TRIPS_CACHE_DIR", ".cache")
 
-def apply_color_weekday(row):
-    colors = {
-        "Sunday": "#ff2b2b",
-        "Monday": "#092d52",
-        "Tuesday": "#29b09d",
-        "Wednesday": "#ffd16a",
-        "Thursday": "#7defa1",
-        "Friday": "#83c9ff",
-        "Saturday": "#ffabab",
-    }
+# How often the source is checked for appended or corrected trips, by default only when the server starts
+TRIPS_REFRESH_SECONDS = int(os.environ["TAXI_TRIPS_REFRESH_SECONDS"]) if "TAXI_TRIPS_REFRESH_SECONDS" in os.environ else None
 
-    return colors[row["Weekday"]]
+# Streams the CSV in chunks of this many rows straight into the cube, for sources larger than memory
+TRIPS_CHUNK_SIZE = os.environ.get("TAXI_TRIPS_CHUNK_SIZE")
+TRIPS_STORE = os.environ.get("TAXI_TRIPS_STORE")
 
-def apply_weekday(row):
-    parsed_timestamp = datetime.datetime.strptime(row["Trip Start Timestamp"], "%m/%d/%Y %I:%M:%S %p")
+TRIPS_WORKERS = int(os.environ.get("TAXI_TRIPS_WORKERS", os.cpu_count() or 1))
 
-    return parsed_timestamp.strftime("%A")
+# "pandas" rolls up the in-memory cube, "duckdb" queries the Parquet store written by chunked ingestion in place
+TRIPS_BACKEND = os.environ.get("TAXI_TRIPS_BACKEND", "pandas")
 
-@st.cache_data
-def load_data():
-    url = "https://www.dropbox.com/scl/fi/ftt2wzhzpjbemcovcayl0/taxi-trips.csv?rlkey=sxyqqsdmoug4mhpb1raiiugws&st=zy6h9ru0&dl=1"
-    data = pd.read_csv(url)
-    data = data.rename(columns={"Pickup Centroid Latitude": "latitude", "Pickup Centroid Longitude": "longitude"})
+# Keeps only the columns the dashboard reads, in float32 and categoricals
+TRIPS_COMPACT = os.environ.get("TAXI_TRIPS_COMPACT", "") not in ("", "0")
 
-    data.loc[data["Company"] == "Taxicab Insurance Agency Llc", "Company"] = "Taxicab Insurance Agency, LLC"
-    data.loc[data["Company"] == "Choice Taxi Association Inc", "Company"] = "Choice Taxi Association"
-    data.loc[data["Company"] == "Blue Ribbon Taxi Association Inc.", "Company"] = "Blue Ribbon Taxi Association"
-    data.loc[data["Company"] == "Taxi Affiliation Services Llc - Yell", "Company"] = "Taxi Affiliation Services"
+TRIPS_PROFILE = os.environ.get("TAXI_TRIPS_PROFILE", "") not in ("", "0")
 
-    data["Weekday"] = data.apply(apply_weekday, 1)
+# Trips kept per company and day for the metrics and company charts shown while the exact ones are computed
+TRIPS_SAMPLE_SIZE = int(os.environ["TAXI_TRIPS_SAMPLE_SIZE"]) if "TAXI_TRIPS_SAMPLE_SIZE" in os.environ else None
 
-    return data
+# About what drawing the estimates takes, exact values that arrive sooner are shown without them
+SAMPLE_GRACE_SECONDS = 0.05
 
-data = load_data()
+def ingest_with_progress(sampler):
+    progress_bar = st.progress(0.0, "Loading trips")
+    cube = ingest_trips(TRIPS_SOURCE, int(TRIPS_CHUNK_SIZE), TRIPS_STORE, lambda rows, fraction: progress_bar.progress(fraction or 0.0, "Loaded {:,} trips".format(rows)), compact=TRIPS_COMPACT, sampler=sampler)
+    progress_bar.empty()
 
-selected_company = st.selectbox(label="Company", options=data["Company"].sort_values().unique(), index=None)
+    return cube
 
-default_date_start = datetime.date(2024, 1, 1)
-default_date_end = datetime.date(2024, 3, 1)
-selected_date_range = st.date_input("Date", (default_date_start, default_date_end), default_date_start, default_date_end)
+def load_backend(sampler):
+    if TRIPS_BACKEND == "duckdb":
+        if TRIPS_CHUNK_SIZE is None or TRIPS_STORE is None:
+            raise ValueError("The duckdb backend needs TAXI_TRIPS_CHUNK_SIZE and TAXI_TRIPS_STORE to build its Parquet store")
 
-selected_date_start, selected_date_end = selected_date_range
-data = data[(data["Trip Start Timestamp"] >= selected_date_start.strftime("%m/%d/%Y %I:%M:%S %p")) & (data["Trip Start Timestamp"] <= selected_date_end.strftime("%m/%d/%Y %I:%M:%S %p"))]
+        ingest_with_progress(sampler)
+        return DuckDBBackend(TRIPS_STORE, threads=TRIPS_WORKERS)
 
-if selected_company != None:
-    col1, col2 = st.columns(2)
-
-    with col1:
-        st.metric(label="Trips", value=data.groupby(["Company"]).size()[selected_company])
-        st.metric(label="Average fare", value='${:,.2f}'.format(data[data["Company"] == selected_company]["Fare"].mean()))
-        minutes, seconds = divmod(datetime.timedelta(seconds=data[data["Company"] == selected_company]["Trip Seconds"].mean()).seconds % 3600, 60)
-        st.metric(label="Average duration", value="{}m {}s".format(minutes, seconds))
-
-    with col2:
-        st.metric(label="Amount made", value='${:,.2f}'.format(data[data["Company"] == selected_company]["Trip Total"].sum()))
-        st.metric(label="Average tip", value='${:,.2f}'.format(data[data["Company"] == selected_company]["Tips"].mean()))
-        st.metric(label="Average distance", value='{:.2f} miles'.format(data[data["Company"] == selected_company]["Trip Miles"].mean()))
-
-    st.subheader("Most used payment types", divider="rainbow")
-
-    # Bar chart
-    payment_bar_data = data[data["Company"] == selected_company].groupby(["Payment Type"], as_index=False).size();
-    payment_bar_data["color"] = payment_bar_data.apply(apply_color_payment, axis=1)
-
-    st.altair_chart(alt.Chart(payment_bar_data).mark_bar().encode(x="Payment Type", y="size", color=alt.Color("color").scale(None)).properties(height=500), use_container_width=True)
-
-    # Map
-    payment_map_data = data[data["Company"] == selected_company].groupby(["latitude", "longitude"], as_index=False)["Payment Type"].agg(pd.Series.mode)
-    payment_map_data["Payment Type"] = payment_map_data["Payment Type"].map(lambda val : val if(isinstance(val, str)) else val[0])
-    payment_map_data["color"] = payment_map_data.apply(apply_color_payment, 1)
-
-    st.map(payment_map_data, color="color", size=300)
-
-    heatmap_prepared_data = data[data["Company"] == selected_company].dropna(subset=["latitude"]).groupby(["latitude", "longitude"], as_index=False).size()
-
-    st.subheader("Trips heatmap", divider="rainbow")
-    st.pydeck_chart(pdk.Deck(
-        map_style=None,
-        initial_view_state=pdk.ViewState(
-            latitude=41.876984,
-            longitude=-87.629704,
-            zoom=8.5,
-            pitch=0,
-        ),
-        layers=[
-            pdk.Layer(
-                'HeatmapLayer',
-                data=heatmap_prepared_data,
-                get_position='[longitude, latitude]',
-                get_weight='size',
-                radius=1000,
-                pickable=False,
-                extruded=True,
-            ),
-        ],
-    ))
-
-    st.subheader("Fare map", divider="rainbow")
-
-    fare_map_data = data[data["Company"] == selected_company].groupby(["latitude", "longitude"], as_index=False)["Fare"].mean()
-
-    st.pydeck_chart(pdk.Deck(
-        map_style=None,
-        initial_view_state=pdk.ViewState(
-            latitude=41.876984,
-            longitude=-87.629704,
-            zoom=8.5,
-            pitch=55,
-        ),
-        layers=[
-            pdk.Layer(
-                'ColumnLayer',
-                data=fare_map_data,
-                extruded=True,
-                get_position='[longitude, latitude]',
-                radius=400,
-                get_elevation="Fare",
-                elevation_scale=200,
-                get_fill_color=['Fare / 3', 0, 'Fare * 2'],
-            )
-        ]
-    ))
-
-    st.subheader("Tips map", divider="rainbow")
-
-    tips_map_data = data[data["Company"] == selected_company].groupby(["latitude", "longitude"], as_index=False)["Tips"].mean()
-
-    st.pydeck_chart(pdk.Deck(
-        map_style=None,
-        initial_view_state=pdk.ViewState(
-            latitude=41.876984,
-            longitude=-87.629704,
-            zoom=8.2,
-            pitch=55,
-        ),
-        layers=[
-            pdk.Layer(
-                'ColumnLayer',
-                data=tips_map_data,
-                extruded=True,
-                get_position='[longitude, latitude]',
-                radius=400,
-                get_elevation="Tips",
-                elevation_scale=1500,
-                get_fill_color=['Tips * 7 / 2', 0, 'Tips * 60'],
-            )
-        ]
-    ))
-
-    st.subheader("Duration map", divider="rainbow")
-
-    duration_map_data = data[data["Company"] == selected_company].groupby(["latitude", "longitude"], as_index=False)["Trip Seconds"].mean()
-    duration_map_data["time"] = duration_map_data["Trip Seconds"]
-    
-    st.pydeck_chart(pdk.Deck(
-        map_style=None,
-        initial_view_state=pdk.ViewState(
-            latitude=41.876984,
-            longitude=-87.629704,
-            zoom=8.5,
-            pitch=50,
-        ),
-        layers=[
-            pdk.Layer(
-                'ColumnLayer',
-                data=duration_map_data,
-                extruded=True,
-                get_position='[longitude, latitude]',
-                radius=200,
-                get_elevation="time",
-                elevation_scale=5,
-                get_fill_color=['time / 10', 0, 'time * 5'],
-            )
-        ]
-    ))
-
-    st.subheader("Distance map", divider="rainbow")
-
-    distance_map_data = data[data["Company"] == selected_company].groupby(["latitude", "longitude"], as_index=False)["Trip Miles"].mean()
-    distance_map_data["distance"] = distance_map_data["Trip Miles"]
-
-    st.pydeck_chart(pdk.Deck(
-        map_style=None,
-        initial_view_state=pdk.ViewState(
-            latitude=41.876984,
-            longitude=-87.629704,
-            zoom=8.5,
-            pitch=50,
-        ),
-        layers=[
-            pdk.Layer(
-                'ColumnLayer',
-                data=distance_map_data,
-                extruded=True,
-                get_position='[longitude, latitude]',
-                radius=200,
-                get_elevation="distance",
-                elevation_scale=1100,
-                get_fill_color=['distance * 10', 0, 'distance * 50'],
-            )
-        ]
-    ))
-
-else:
-    col1, col2 = st.columns(2)
-
-    with col1:
-        st.metric(label="Trips", value=data.groupby(["Company"]).size().sum())
-        st.metric(label="Average fare", value='${:,.2f}'.format(data["Fare"].mean()))
-        minutes, seconds = divmod(datetime.timedelta(seconds=data["Trip Seconds"].mean()).seconds % 3600, 60)
-        st.metric(label="Average duration", value="{}m {}s".format(minutes, seconds))
-
-    with col2:
-        st.metric(label="Amount made", value='${:,.2f}'.format(data["Trip Total"].sum()))
-        st.metric(label="Average tip", value='${:,.2f}'.format(data["Tips"].mean()))
-        st.metric(label="Average distance", value='{:.2f} miles'.format(data["Trip Miles"].mean()))
-
-    general_tab, companies_tab, weekdays_tab = st.tabs(["General", "Compare companies", "Weekdays"])
-
-    with general_tab:
-        st.subheader("Most used payment types", divider="rainbow")
-
-        # Bar chart
-        payment_bar_data = data.groupby(["Payment Type"], as_index=False).size();
-        payment_bar_data["color"] = payment_bar_data.apply(apply_color_payment, axis=1)
-
-        st.altair_chart(alt.Chart(payment_bar_data).mark_bar().encode(x="Payment Type", y=alt.Y("size", title="Times used"), color=alt.Color("color").scale(None)).properties(height=500), use_container_width=True)
-
-        # Map
-        payment_map_data = data.groupby(["latitude", "longitude"], as_index=False)["Payment Type"].agg(pd.Series.mode)
-        payment_map_data["Payment Type"] = payment_map_data["Payment Type"].map(lambda val : val if(isinstance(val, str)) else val[0])
-        payment_map_data["color"] = payment_map_data.apply(apply_color_payment, 1)
-
-        st.map(payment_map_data, color="color", size=300)
-
-        heatmap_prepared_data = data.dropna(subset=["latitude"]).groupby(["latitude", "longitude"], as_index=False).size()
-
-        st.subheader("Trips heatmap", divider="rainbow")
-        st.pydeck_chart(pdk.Deck(
-            map_style=None,
-            initial_view_state=pdk.ViewState(
-                latitude=41.876984,
-                longitude=-87.629704,
-                zoom=8.5,
-                pitch=0,
-            ),
-            layers=[
-                pdk.Layer(
-                    'HeatmapLayer',
-                    data=heatmap_prepared_data,
-                    get_position='[longitude, latitude]',
-                    radius=500,
-                    get_weight='size',
-                    pickable=False,
-                    extruded=True,
-                ),
-            ],
-        ))
-
-
-        st.subheader("Fare map", divider="rainbow")
-
-        fare_map_data = data.groupby(["latitude", "longitude"], as_index=False)["Fare"].mean()
-
-        st.pydeck_chart(pdk.Deck(
-            map_style=None,
-            initial_view_state=pdk.ViewState(
-                latitude=41.876984,
-                longitude=-87.629704,
-                zoom=8.5,
-                pitch=55,
-            ),
-            layers=[
-                pdk.Layer(
-                    'ColumnLayer',
-                    data=fare_map_data,
-                    extruded=True,
-                    get_position='[longitude, latitude]',
-                    radius=400,
-                    get_elevation="Fare",
-                    elevation_scale=100,
-                    get_fill_color=['Fare / 3', 0, 'Fare * 2'],
-                )
-            ]
-        ))
-
-        st.subheader("Tips map", divider="rainbow")
-
-        tips_map_data = data.groupby(["latitude", "longitude"], as_index=False)["Tips"].mean()
-
-        st.pydeck_chart(pdk.Deck(
-            map_style=None,
-            initial_view_state=pdk.ViewState(
-                latitude=41.876984,
-                longitude=-87.629704,
-                zoom=8.2,
-                pitch=55,
-            ),
-            layers=[
-                pdk.Layer(
-                    'ColumnLayer',
-                    data=tips_map_data,
-                    extruded=True,
-                    get_position='[longitude, latitude]',
-                    radius=400,
-                    get_elevation="Tips",
-                    elevation_scale=1500,
-                    get_fill_color=['Tips * 7 / 2', 0, 'Tips * 60'],
-                )
-            ]
-        ))
-
-        st.subheader("Duration map", divider="rainbow")
-
-        duration_map_data = data.groupby(["latitude", "longitude"], as_index=False)["Trip Seconds"].mean()
-        duration_map_data["time"] = duration_map_data["Trip Seconds"]
-        
-        st.pydeck_chart(pdk.Deck(
-            map_style=None,
-            initial_view_state=pdk.ViewState(
-                latitude=41.876984,
-                longitude=-87.629704,
-                zoom=8.5,
-                pitch=50,
-            ),
-            layers=[
-                pdk.Layer(
-                    'ColumnLayer',
-                    data=duration_map_data,
-                    extruded=True,
-                    get_position='[longitude, latitude]',
-                    radius=200,
-                    get_elevation="time",
-                    elevation_scale=5,
-                    get_fill_color=['time / 10', 0, 'time * 5'],
-                )
-            ]
-        ))
-
-        st.subheader("Distance map", divider="rainbow")
-
-        distance_map_data = data.groupby(["latitude", "longitude"], as_index=False)["Trip Miles"].mean()
-        distance_map_data["distance"] = distance_map_data["Trip Miles"]
-
-        st.pydeck_chart(pdk.Deck(
-            map_style=None,
-            initial_view_state=pdk.ViewState(
-                latitude=41.876984,
-                longitude=-87.629704,
-                zoom=8.5,
-                pitch=50,
-            ),
-            layers=[
-                pdk.Layer(
-                    'ColumnLayer',
-                    data=distance_map_data,
-                    extruded=True,
-                    get_position='[longitude, latitude]',
-                    radius=200,
-                    get_elevation="distance",
-                    elevation_scale=1100,
-                    get_fill_color=['distance * 10', 0, 'distance * 50'],
-                )
-            ]
-        ))
-
-    with companies_tab:
-        company_trips_data = data.groupby(["Company"], as_index=False).size().sort_values(by=["size"], ascending=False)[0:8]
-        st.altair_chart(alt.Chart(company_trips_data).mark_bar().encode(x=alt.X("Company", sort="-y"), y=alt.Y("size", title="Trips completed"), color=alt.Color("Company", legend=None)).properties(height=500), use_container_width=True)
-
-        company_amount_data = data.groupby(["Company"], as_index=False)["Trip Total"].sum().sort_values(by=["Trip Total"], ascending=False)[0:8]
-        st.altair_chart(alt.Chart(company_amount_data).mark_bar().encode(x=alt.X("Company", sort="-y"), y=alt.Y("Trip Total", title="Amount made (dollars)"), color=alt.Color("Company", legend=None)).properties(height=500), use_container_width=True)
-
-        average_fare_data = data.groupby(["Company"], as_index=False)["Fare"].mean().sort_values(by=["Fare"], ascending=False)[0:8]
-        st.altair_chart(alt.Chart(average_fare_data).mark_bar().encode(x=alt.X("Company", sort="-y"), y=alt.Y("Fare", title="Average fare (dollars)"), color=alt.Color("Company", legend=None)).properties(height=500), use_container_width=True)
-
-        average_seconds_data = data.groupby(["Company"], as_index=False)["Trip Seconds"].mean().sort_values(by=["Trip Seconds"], ascending=False)[0:8]
-        st.altair_chart(alt.Chart(average_seconds_data).mark_bar().encode(x=alt.X("Company", sort="-y"), y=alt.Y("Trip Seconds", title="Average trip duration (seconds)"), color=alt.Color("Company", legend=None)).properties(height=500), use_container_width=True)
+    if TRIPS_CHUNK_SIZE is None:
+        cube = load_cached_cube(TRIPS_SOURCE, TRIPS_CACHE_DIR, TRIPS_COMPACT)
+        if sampler is not None:
+            sampler.add(load_cached_trips(TRIPS_SOURCE, TRIPS_CACHE_DIR, TRIPS_COMPACT))
 
-        average_tips_data = data.groupby(["Company"], as_index=False)["Tips"].mean().sort_values(by=["Tips"], ascending=False)[0:8]
-        st.altair_chart(alt.Chart(average_tips_data).mark_bar().encode(x=alt.X("Company", sort="-y"), y=alt.Y("Tips", title="Average tip (dollars)"), color=alt.Color("Company", legend=None)).properties(height=500), use_container_width=True)
+        return PandasBackend(cube)
 
-        average_distance_data = data.groupby(["Company"], as_index=False)["Trip Miles"].mean().sort_values(by=["Trip Miles"], ascending=False)[0:8]
-        st.altair_chart(alt.Chart(average_distance_data).mark_bar().encode(x=alt.X("Company", sort="-y"), y=alt.Y("Trip Miles", title="Average distance (miles)"), color=alt.Color("Company", legend=None)).properties(height=500), use_container_width=True)
+    return PandasBackend(ingest_with_progress(sampler))
 
-    with weekdays_tab:
-        sort_order = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
-        companies_to_keep = data.groupby(["Company"], as_index=False).size().sort_values(by=["size"], ascending=False)[:15]["Company"]
+# Every session shares the one backend instead of unpickling its own copy, so nothing may modify its cube in place.
+# The sample backend, when there is one, is filled while the trips are loaded
+@st.cache_resource(ttl=TRIPS_REFRESH_SECONDS)
+def load_backends():
+    sampler = StratifiedSampler(TRIPS_SAMPLE_SIZE) if TRIPS_SAMPLE_SIZE is not None else None
+    backend = load_backend(sampler)
 
-        weekday_with_most_trips_per_location = data.groupby(["latitude", "longitude"], as_index=False)["Weekday"].agg(pd.Series.mode)
-        weekday_with_most_trips_per_location["Weekday"] = weekday_with_most_trips_per_location["Weekday"].map(lambda val : val if(isinstance(val, str)) else val[0])
-        weekday_with_most_trips_per_location["color"] = weekday_with_most_trips_per_location.apply(apply_color_weekday, 1)
-        st.map(weekday_with_most_trips_per_location, color="color", size=300)
+    return backend, sampler.backend() if sampler is not None else None
 
-        trips_per_weekday_data = data.groupby(["Weekday"], as_index=False).size()
-        st.altair_chart(alt.Chart(trips_per_weekday_data).mark_bar().encode(x=alt.X("Weekday", sort=sort_order), y=alt.Y("size", title="Trips completed"), color=alt.Color("Weekday", legend=None)).properties(height=500), use_container_width=True)
+# pandas releases the GIL in its groupby kernels, so chart datasets are computed side by side on threads
+@st.cache_resource
+def get_executor():
+    return ThreadPoolExecutor(max_workers=TRIPS_WORKERS)
 
-        amount_per_weekday_data = data.groupby(["Weekday"], as_index=False)["Trip Total"].sum()
-        st.altair_chart(alt.Chart(amount_per_weekday_data).mark_bar().encode(x=alt.X("Weekday", sort=sort_order), y=alt.Y("Trip Total", title="Amount made (dollars)"), color=alt.Color("Weekday", legend=None)).properties(height=500), use_container_width=True)
+# One pass over the locations feeds every map layer, the columns are renamed so deck.gl expressions can use them
+@st.cache_data(ttl=TRIPS_REFRESH_SECONDS)
+def load_location_stats(start_date, end_date, company, cell_shape, cell_size):
+    stats = load_backends()[0].filter(start_date, end_date, company).location_stats(cell_shape, cell_size)
 
-        average_fare_per_weekday_data = data.groupby(["Weekday"], as_index=False)["Fare"].mean()
-        st.altair_chart(alt.Chart(average_fare_per_weekday_data).mark_bar().encode(x=alt.X("Weekday", sort=sort_order), y=alt.Y("Fare", title="Average fare (dollars)"), color=alt.Color("Weekday", legend=None)).properties(height=500), use_container_width=True)
+    return stats.rename(columns={"Trip Seconds": "time", "Trip Miles": "distance"})
 
-        average_tip_per_weekday_data = data.groupby(["Weekday"], as_index=False)["Tips"].mean()
-        st.altair_chart(alt.Chart(average_tip_per_weekday_data).mark_bar().encode(x=alt.X("Weekday", sort=sort_order), y=alt.Y("Tips", title="Average tip (dollars)"), color=alt.Color("Weekday", legend=None)).properties(height=500), use_container_width=True)
+def show_metrics(values, approximate=False):
+    # Estimates carry the half-width of their 95% interval
+    def bounds(error, format):
+        return " ± " + format.format(error) if approximate else ""
 
-        average_duration_per_weekday_data = data.groupby(["Weekday"], as_index=False)["Trip Seconds"].mean()
-        st.altair_chart(alt.Chart(average_duration_per_weekday_data).mark_bar().encode(x=alt.X("Weekday", sort=sort_order), y=alt.Y("Trip Seconds", title="Average duration (seconds)"), color=alt.Color("Weekday", legend=None)).properties(height=500), use_container_width=True)
-
-        company_trips_per_weekday_data = data[data["Company"].isin(companies_to_keep)].groupby(["Weekday", "Company"], as_index=False).size()
-        st.altair_chart(alt.Chart(company_trips_per_weekday_data).mark_bar().encode(x=alt.X("Weekday", sort=sort_order), xOffset="Company", y=alt.Y("size", title="Trips Completed"), color=alt.Color("Company")).properties(height=500), use_container_width=True)
-
-        company_amount_per_weekday_data = data[data["Company"].isin(companies_to_keep)].groupby(["Weekday", "Company"], as_index=False)["Trip Total"].sum()
-        st.altair_chart(alt.Chart(company_amount_per_weekday_data).mark_bar().encode(x=alt.X("Weekday", sort=sort_order), xOffset="Company", y=alt.Y("Trip Total", title="Amount made (dollars)"), color=alt.Color("Company")).properties(height=500), use_container_width=True)
+    col1, col2 = st.columns(2)
 
-        payment_type_per_weekday_data = data.groupby(["Weekday", "Payment Type"], as_index=False).size()
-        st.altair_chart(alt.Chart(payment_type_per_weekday_data).mark_bar().encode(x=alt.X("Weekday", sort=sort_order), xOffset="Payment Type", y=alt.Y("size", title="Times used"), color=alt.Color("Payment Type")).properties(height=500), use_container_width=True)
+    with col1:
+        st.metric(label="Trips", value='{:,.0f}'.format(values["size"]) + bounds(values.get("size error"), "{:,.0f}") if approximate else values["size"])
+        st.metric(label="Average fare", value='${:,.2f}'.format(mean(values, "Fare")) + bounds(values.get("Fare mean error"), "${:,.2f}"))
+        minutes, seconds = divmod(datetime.timedelta(seconds=mean(values, "Trip Seconds")).seconds % 3600, 60)
+        st.metric(label="Average duration", value="{}m {}s".format(minutes, seconds) + bounds(values.get("Trip Seconds mean error"), "{:,.0f}s"))
 
+    with col2:
+        st.metric(label="Amount made", value='${:,.2f}'.format(values["Trip Total"]) + bounds(values.get("Trip Total error"), "${:,.2f}"))
+        st.metric(label="Average tip", value='${:,.2f}'.format(mean(values, "Tips")) + bounds(values.get("Tips mean error"), "${:,.2f}"))
+        st.metric(label="Average distance", value='{:.2f} miles'.format(mean(values, "Trip Miles")) + bounds(values.get("Trip Miles mean error"), "{:.2f}"))
+
+def company_ranking(trips, column, average):
+    ranking = trips.rollup(["Company"], columns=[], means=[column]) if average else trips.rollup(["Company"], columns=[column])
+
+    return ranking.sort_values(by=[column], ascending=False)[0:8]
+
+def company_chart(data, column, title):
+    chart = alt.Chart(data).mark_bar().encode(x=alt.X("Company", sort="-y"), y=alt.Y(column, title=title), color=alt.Color("Company", legend=None))
+
+    # Estimates get error bars spanning their 95% intervals
+    if column + " error" in data:
+        bounds = data.assign(low=data[column] - data[column + " error"], high=data[column] + data[column + " error"])
+        chart = chart + alt.Chart(bounds).mark_errorbar().encode(x=alt.X("Company", sort="-y"), y=alt.Y("low", title=title), y2="high")
+
+    return chart.properties(height=500)
+
+# Times every section of the rerun, for every session with TAXI_TRIPS_PROFILE or for one with ?profile=1
+profiler = Profiler(TRIPS_PROFILE or st.query_params.get("profile") == "1")
+
+# Work this rerun hands to the shared executor. Streamlit ends an interrupted rerun by raising, and whatever
+# is still queued then is cancelled, so the next rerun of any session doesn't wait behind it
+submitted = []
+
+# The profiler is finished however the rerun ends too
+try:
+    with profiler.section("load"):
+        backend, sample_backend = load_backends()
+
+        selected_company = st.selectbox(label="Company", options=backend.companies(), index=None)
+
+    default_date_start = datetime.date(2024, 1, 1)
+    default_date_end = datetime.date(2024, 3, 1)
+    selected_date_range = st.date_input("Date", (default_date_start, default_date_end), default_date_start, default_date_end)
+
+    # Snapping the pickup centroids to cells sized for the decks' zoom bounds the number of points sent to the browser
+    map_cell_shape = st.sidebar.selectbox("Map cells", [None] + list(CELL_SHAPES), format_func=lambda shape: "Pickup centroids" if shape is None else shape)
+    map_cell_pixels = st.sidebar.slider("Map cell size (pixels)", 2, 32, 8, disabled=map_cell_shape is None)
+    map_cell_size = cell_size_for_zoom(8.5, map_cell_pixels)
+
+    selected_date_start, selected_date_end = selected_date_range
+    with profiler.section("filter"):
+        trips = backend.filter(selected_date_start, selected_date_end, selected_company)
+
+    # With a sample, estimates are shown right away and replaced once the exact values are in.
+    # The exact ones are computed meanwhile, and when they are ready first there is nothing to estimate
+    metrics = st.empty()
+    exact_values = get_executor().submit(trips.totals)
+    submitted.append(exact_values)
+    sampled_trips = sample_backend.filter(selected_date_start, selected_date_end, selected_company) if sample_backend is not None else None
+    if sampled_trips is not None and wait([exact_values], timeout=SAMPLE_GRACE_SECONDS).not_done:
+        with profiler.section("sampled metrics"):
+            with metrics.container():
+                show_metrics(sampled_trips.totals(), approximate=True)
+
+    with profiler.section("metrics") as section:
+        values = exact_values.result()
+        section.rows = int(values["size"])
+        with metrics.container():
+            show_metrics(values)
+
+    if selected_company != None:
+        with profiler.section("payment types chart") as section:
+            st.subheader("Most used payment types", divider="rainbow")
+
+            # Bar chart
+            payment_bar_data = trips.rollup(["Payment Type"]);
+            payment_bar_data["color"] = payment_bar_data["Payment Type"].map(PAYMENT_COLORS).astype(str)
+
+            st.altair_chart(section.output(alt.Chart(payment_bar_data).mark_bar().encode(x="Payment Type", y="size", color=alt.Color("color").scale(None)).properties(height=500)), use_container_width=True)
+
+        with profiler.section("payment types map") as section:
+            # Map
+            payment_map_data = trips.location_mode("Payment Type", map_cell_shape, map_cell_size)
+            payment_map_data["color"] = payment_map_data["Payment Type"].map(PAYMENT_COLORS).astype(str)
+
+            st.map(section.output(payment_map_data), color="color", size=300)
+
+        with profiler.section("location stats") as section:
+            location_stats_data = section.output(load_location_stats(selected_date_start, selected_date_end, selected_company, map_cell_shape, map_cell_size))
+
+        with profiler.section("trips heatmap") as section:
+            heatmap_prepared_data = location_stats_data[["latitude", "longitude", "size"]]
+
+            st.subheader("Trips heatmap", divider="rainbow")
+            st.pydeck_chart(section.output(pdk.Deck(
+                map_style=None,
+                initial_view_state=pdk.ViewState(
+                    latitude=41.876984,
+                    longitude=-87.629704,
+                    zoom=8.5,
+                    pitch=0,
+                ),
+                layers=[
+                    pdk.Layer(
+                        'HeatmapLayer',
+                        data=heatmap_prepared_data,
+                        get_position='[longitude, latitude]',
+                        get_weight='size',
+                        radius=1000,
+                        pickable=False,
+                        extruded=True,
+                    ),
+                ],
+            )))
+
+        with profiler.section("fare map") as section:
+            st.subheader("Fare map", divider="rainbow")
+
+            fare_map_data = location_stats_data[["latitude", "longitude", "Fare"]]
+
+            st.pydeck_chart(section.output(pdk.Deck(
+                map_style=None,
+                initial_view_state=pdk.ViewState(
+                    latitude=41.876984,
+                    longitude=-87.629704,
+                    zoom=8.5,
+                    pitch=55,
+                ),
+                layers=[
+                    pdk.Layer(
+                        'ColumnLayer',
+                        data=fare_map_data,
+                        extruded=True,
+                        get_position='[longitude, latitude]',
+                        radius=400,
+                        get_elevation="Fare",
+                        elevation_scale=200,
+                        get_fill_color=['Fare / 3', 0, 'Fare * 2'],
+                    )
+                ]
+            )))
+
+        with profiler.section("tips map") as section:
+            st.subheader("Tips map", divider="rainbow")
+
+            tips_map_data = location_stats_data[["latitude", "longitude", "Tips"]]
+
+            st.pydeck_chart(section.output(pdk.Deck(
+                map_style=None,
+                initial_view_state=pdk.ViewState(
+                    latitude=41.876984,
+                    longitude=-87.629704,
+                    zoom=8.2,
+                    pitch=55,
+                ),
+                layers=[
+                    pdk.Layer(
+                        'ColumnLayer',
+                        data=tips_map_data,
+                        extruded=True,
+                        get_position='[longitude, latitude]',
+                        radius=400,
+                        get_elevation="Tips",
+                        elevation_scale=1500,
+                        get_fill_color=['Tips * 7 / 2', 0, 'Tips * 60'],
+                    )
+                ]
+            )))
+
+        with profiler.section("duration map") as section:
+            st.subheader("Duration map", divider="rainbow")
+
+            duration_map_data = location_stats_data[["latitude", "longitude", "time"]]
+    
+            st.pydeck_chart(section.output(pdk.Deck(
+                map_style=None,
+                initial_view_state=pdk.ViewState(
+                    latitude=41.876984,
+                    longitude=-87.629704,
+                    zoom=8.5,
+                    pitch=50,
+                ),
+                layers=[
+                    pdk.Layer(
+                        'ColumnLayer',
+                        data=duration_map_data,
+                        extruded=True,
+                        get_position='[longitude, latitude]',
+                        radius=200,
+                        get_elevation="time",
+                        elevation_scale=5,
+                        get_fill_color=['time / 10', 0, 'time * 5'],
+                    )
+                ]
+            )))
+
+        with profiler.section("distance map") as section:
+            st.subheader("Distance map", divider="rainbow")
+
+            distance_map_data = location_stats_data[["latitude", "longitude", "distance"]]
+
+            st.pydeck_chart(section.output(pdk.Deck(
+                map_style=None,
+                initial_view_state=pdk.ViewState(
+                    latitude=41.876984,
+                    longitude=-87.629704,
+                    zoom=8.5,
+                    pitch=50,
+                ),
+                layers=[
+                    pdk.Layer(
+                        'ColumnLayer',
+                        data=distance_map_data,
+                        extruded=True,
+                        get_position='[longitude, latitude]',
+                        radius=200,
+                        get_elevation="distance",
+                        elevation_scale=1100,
+                        get_fill_color=['distance * 10', 0, 'distance * 50'],
+                    )
+                ]
+            )))
+
+    else:
+        # st.tabs runs every tab's code on each rerun, a radio bar only computes the tab being looked at
+        selected_tab = st.radio("Tab", ["General", "Compare companies", "Weekdays"], horizontal=True, label_visibility="collapsed")
+
+        if selected_tab == "General":
+            with profiler.section("payment types chart") as section:
+                st.subheader("Most used payment types", divider="rainbow")
+
+                # Bar chart
+                payment_bar_data = trips.rollup(["Payment Type"]);
+                payment_bar_data["color"] = payment_bar_data["Payment Type"].map(PAYMENT_COLORS).astype(str)
+
+                st.altair_chart(section.output(alt.Chart(payment_bar_data).mark_bar().encode(x="Payment Type", y=alt.Y("size", title="Times used"), color=alt.Color("color").scale(None)).properties(height=500)), use_container_width=True)
+
+            with profiler.section("payment types map") as section:
+                # Map
+                payment_map_data = trips.location_mode("Payment Type", map_cell_shape, map_cell_size)
+                payment_map_data["color"] = payment_map_data["Payment Type"].map(PAYMENT_COLORS).astype(str)
+
+                st.map(section.output(payment_map_data), color="color", size=300)
+
+            with profiler.section("location stats") as section:
+                location_stats_data = section.output(load_location_stats(selected_date_start, selected_date_end, selected_company, map_cell_shape, map_cell_size))
+
+            with profiler.section("trips heatmap") as section:
+                heatmap_prepared_data = location_stats_data[["latitude", "longitude", "size"]]
+
+                st.subheader("Trips heatmap", divider="rainbow")
+                st.pydeck_chart(section.output(pdk.Deck(
+                    map_style=None,
+                    initial_view_state=pdk.ViewState(
+                        latitude=41.876984,
+                        longitude=-87.629704,
+                        zoom=8.5,
+                        pitch=0,
+                    ),
+                    layers=[
+                        pdk.Layer(
+                            'HeatmapLayer',
+                            data=heatmap_prepared_data,
+                            get_position='[longitude, latitude]',
+                            radius=500,
+                            get_weight='size',
+                            pickable=False,
+                            extruded=True,
+                        ),
+                    ],
+                )))
+
+
+            with profiler.section("fare map") as section:
+                st.subheader("Fare map", divider="rainbow")
+
+                fare_map_data = location_stats_data[["latitude", "longitude", "Fare"]]
+
+                st.pydeck_chart(section.output(pdk.Deck(
+                    map_style=None,
+                    initial_view_state=pdk.ViewState(
+                        latitude=41.876984,
+                        longitude=-87.629704,
+                        zoom=8.5,
+                        pitch=55,
+                    ),
+                    layers=[
+                        pdk.Layer(
+                            'ColumnLayer',
+                            data=fare_map_data,
+                            extruded=True,
+                            get_position='[longitude, latitude]',
+                            radius=400,
+                            get_elevation="Fare",
+                            elevation_scale=100,
+                            get_fill_color=['Fare / 3', 0, 'Fare * 2'],
+                        )
+                    ]
+                )))
+
+            with profiler.section("tips map") as section:
+                st.subheader("Tips map", divider="rainbow")
+
+                tips_map_data = location_stats_data[["latitude", "longitude", "Tips"]]
+
+                st.pydeck_chart(section.output(pdk.Deck(
+                    map_style=None,
+                    initial_view_state=pdk.ViewState(
+                        latitude=41.876984,
+                        longitude=-87.629704,
+                        zoom=8.2,
+                        pitch=55,
+                    ),
+                    layers=[
+                        pdk.Layer(
+                            'ColumnLayer',
+                            data=tips_map_data,
+                            extruded=True,
+                            get_position='[longitude, latitude]',
+                            radius=400,
+                            get_elevation="Tips",
+                            elevation_scale=1500,
+                            get_fill_color=['Tips * 7 / 2', 0, 'Tips * 60'],
+                        )
+                    ]
+                )))
+
+            with profiler.section("duration map") as section:
+                st.subheader("Duration map", divider="rainbow")
+
+                duration_map_data = location_stats_data[["latitude", "longitude", "time"]]
+        
+                st.pydeck_chart(section.output(pdk.Deck(
+                    map_style=None,
+                    initial_view_state=pdk.ViewState(
+                        latitude=41.876984,
+                        longitude=-87.629704,
+                        zoom=8.5,
+                        pitch=50,
+                    ),
+                    layers=[
+                        pdk.Layer(
+                            'ColumnLayer',
+                            data=duration_map_data,
+                            extruded=True,
+                            get_position='[longitude, latitude]',
+                            radius=200,
+                            get_elevation="time",
+                            elevation_scale=5,
+                            get_fill_color=['time / 10', 0, 'time * 5'],
+                        )
+                    ]
+                )))
+
+            with profiler.section("distance map") as section:
+                st.subheader("Distance map", divider="rainbow")
+
+                distance_map_data = location_stats_data[["latitude", "longitude", "distance"]]
+
+                st.pydeck_chart(section.output(pdk.Deck(
+                    map_style=None,
+                    initial_view_state=pdk.ViewState(
+                        latitude=41.876984,
+                        longitude=-87.629704,
+                        zoom=8.5,
+                        pitch=50,
+                    ),
+                    layers=[
+                        pdk.Layer(
+                            'ColumnLayer',
+                            data=distance_map_data,
+                            extruded=True,
+                            get_position='[longitude, latitude]',
+                            radius=200,
+                            get_elevation="distance",
+                            elevation_scale=1100,
+                            get_fill_color=['distance * 10', 0, 'distance * 50'],
+                        )
+                    ]
+                )))
+
+        elif selected_tab == "Compare companies":
+            # Column, whether it is averaged, axis title and profile section of each chart
+            company_charts = [
+                ("size", False, "Trips completed", "company trips chart"),
+                ("Trip Total", False, "Amount made (dollars)", "company amount chart"),
+                ("Fare", True, "Average fare (dollars)", "company fare chart"),
+                ("Trip Seconds", True, "Average trip duration (seconds)", "company duration chart"),
+                ("Tips", True, "Average tip (dollars)", "company tips chart"),
+                ("Trip Miles", True, "Average distance (miles)", "company distance chart"),
+            ]
+            chart_data = compute_in_order(get_executor(), [lambda column=column, average=average: company_ranking(trips, column, average) for column, average, _, _ in company_charts])
+            submitted.append(chart_data)
+            chart_placeholders = [st.empty() for _ in company_charts]
+
+            # The sample's charts hold the places of the exact ones while those are computed, like the metrics
+            # only after the grace period, and only for the charts still computing by the time they are drawn
+            if sampled_trips is not None and wait(chart_data.futures, timeout=SAMPLE_GRACE_SECONDS).not_done:
+                with profiler.section("sampled company charts"):
+                    for placeholder, future, (column, average, title, _) in zip(chart_placeholders, chart_data.futures, company_charts):
+                        if not future.done():
+                            placeholder.altair_chart(company_chart(company_ranking(sampled_trips, column, average), column, title), use_container_width=True)
+
+            for placeholder, (column, average, title, name) in zip(chart_placeholders, company_charts):
+                with profiler.section(name) as section:
+                    placeholder.altair_chart(section.output(company_chart(next(chart_data), column, title)), use_container_width=True)
+
+        elif selected_tab == "Weekdays":
+            with profiler.section("top companies"):
+                sort_order = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+                companies_to_keep = trips.rollup(["Company"]).sort_values(by=["size"], ascending=False)[:15]["Company"]
+                top_companies_trips = trips.filter_companies(companies_to_keep)
+
+            chart_data = compute_in_order(get_executor(), [
+                lambda: trips.location_mode("Weekday", map_cell_shape, map_cell_size),
+                lambda: trips.rollup(["Weekday"]),
+                lambda: trips.rollup(["Weekday"], columns=["Trip Total"]),
+                lambda: trips.rollup(["Weekday"], columns=[], means=["Fare"]),
+                lambda: trips.rollup(["Weekday"], columns=[], means=["Tips"]),
+                lambda: trips.rollup(["Weekday"], columns=[], means=["Trip Seconds"]),
+                lambda: top_companies_trips.rollup(["Weekday", "Company"]),
+                lambda: top_companies_trips.rollup(["Weekday", "Company"], columns=["Trip Total"]),
+                lambda: trips.rollup(["Weekday", "Payment Type"]),
+            ])
+            submitted.append(chart_data)
+
+            with profiler.section("weekday map") as section:
+                weekday_with_most_trips_per_location = next(chart_data)
+                weekday_with_most_trips_per_location["color"] = weekday_with_most_trips_per_location["Weekday"].map(WEEKDAY_COLORS).astype(str)
+                st.map(section.output(weekday_with_most_trips_per_location), color="color", size=300)
+
+            with profiler.section("weekday trips chart") as section:
+                trips_per_weekday_data = next(chart_data)
+                st.altair_chart(section.output(alt.Chart(trips_per_weekday_data).mark_bar().encode(x=alt.X("Weekday", sort=sort_order), y=alt.Y("size", title="Trips completed"), color=alt.Color("Weekday", legend=None)).properties(height=500)), use_container_width=True)
+
+            with profiler.section("weekday amount chart") as section:
+                amount_per_weekday_data = next(chart_data)
+                st.altair_chart(section.output(alt.Chart(amount_per_weekday_data).mark_bar().encode(x=alt.X("Weekday", sort=sort_order), y=alt.Y("Trip Total", title="Amount made (dollars)"), color=alt.Color("Weekday", legend=None)).properties(height=500)), use_container_width=True)
+
+            with profiler.section("weekday fare chart") as section:
+                average_fare_per_weekday_data = next(chart_data)
+                st.altair_chart(section.output(alt.Chart(average_fare_per_weekday_data).mark_bar().encode(x=alt.X("Weekday", sort=sort_order), y=alt.Y("Fare", title="Average fare (dollars)"), color=alt.Color("Weekday", legend=None)).properties(height=500)), use_container_width=True)
+
+            with profiler.section("weekday tips chart") as section:
+                average_tip_per_weekday_data = next(chart_data)
+                st.altair_chart(section.output(alt.Chart(average_tip_per_weekday_data).mark_bar().encode(x=alt.X("Weekday", sort=sort_order), y=alt.Y("Tips", title="Average tip (dollars)"), color=alt.Color("Weekday", legend=None)).properties(height=500)), use_container_width=True)
+
+            with profiler.section("weekday duration chart") as section:
+                average_duration_per_weekday_data = next(chart_data)
+                st.altair_chart(section.output(alt.Chart(average_duration_per_weekday_data).mark_bar().encode(x=alt.X("Weekday", sort=sort_order), y=alt.Y("Trip Seconds", title="Average duration (seconds)"), color=alt.Color("Weekday", legend=None)).properties(height=500)), use_container_width=True)
+
+            with profiler.section("weekday company trips chart") as section:
+                company_trips_per_weekday_data = next(chart_data)
+                st.altair_chart(section.output(alt.Chart(company_trips_per_weekday_data).mark_bar().encode(x=alt.X("Weekday", sort=sort_order), xOffset="Company", y=alt.Y("size", title="Trips Completed"), color=alt.Color("Company")).properties(height=500)), use_container_width=True)
+
+            with profiler.section("weekday company amount chart") as section:
+                company_amount_per_weekday_data = next(chart_data)
+                st.altair_chart(section.output(alt.Chart(company_amount_per_weekday_data).mark_bar().encode(x=alt.X("Weekday", sort=sort_order), xOffset="Company", y=alt.Y("Trip Total", title="Amount made (dollars)"), color=alt.Color("Company")).properties(height=500)), use_container_width=True)
+
+            with profiler.section("weekday payment types chart") as section:
+                payment_type_per_weekday_data = next(chart_data)
+                st.altair_chart(section.output(alt.Chart(payment_type_per_weekday_data).mark_bar().encode(x=alt.X("Weekday", sort=sort_order), xOffset="Payment Type", y=alt.Y("size", title="Times used"), color=alt.Color("Payment Type")).properties(height=500)), use_container_width=True)
+finally:
+    for tasks in submitted:
+        tasks.cancel()
+    profile = profiler.finish()
+
+if profiler.enabled:
+    with st.expander("Profile"):
+        st.dataframe(profile, hide_index=True, use_container_width=True)
@@ -0,0 +1,137 @@
+import os
+
+import duckdb
+import pandas as pd
+
+from cube import CUBE_VALUES, LOCATION_MEANS, filter_cube, location_mode, location_stats, rollup, totals
+from ingest import hold_build
+from spatial import bin_cube
+from trips import WEEKDAYS
+
+# Every backend answers the dashboard's queries on a filtered selection of trips:
+# filter, filter_companies, companies, totals, rollup, location_stats and location_mode,
+# returning the same frames as the cube functions they are named after
+
+class PandasBackend:
+    # The reference backend, a rollup of the in-memory cube
+    def __init__(self, cube):
+        self.cube = cube
+
+    def filter(self, start_date, end_date, company=None):
+        return PandasBackend(filter_cube(self.cube, start_date, end_date, company))
+
+    def filter_companies(self, companies):
+        return PandasBackend(self.cube[self.cube["Company"].isin(companies)])
+
+    def companies(self):
+        return list(self.cube["Company"].dropna().sort_values().unique())
+
+    def totals(self):
+        return totals(self.cube)
+
+    def rollup(self, keys, columns=("size",), means=()):
+        return rollup(self.cube, keys, columns=columns, means=means)
+
+    def location_stats(self, cell_shape=None, cell_size=None):
+        return location_stats(bin_cube(self.cube, cell_shape, cell_size))
+
+    def location_mode(self, column, cell_shape=None, cell_size=None):
+        return location_mode(bin_cube(self.cube, cell_shape, cell_size), column)
+
+def quote(column):
+    return '"{}"'.format(column)
+
+def aggregate(value):
+    # The SQL behind each cube column, so the engine's results go through the same rollups
+    if value == "size":
+        return "count(*)"
+    if value.endswith(" count"):
+        return "count({})".format(quote(value[:-len(" count")]))
+    if value.endswith(" squares"):
+        return "sum({0} * {0})".format(quote(value[:-len(" squares")]))
+
+    return "sum({})".format(quote(value))
+
+class DuckDBBackend:
+    # Queries the trips' Parquet store in place, date ranges prune month partitions and row groups
+    # before anything is read, and only the aggregated rows ever reach pandas
+    def __init__(self, store, threads=None, connection=None, where=(), parameters=(), build_lock=None):
+        if connection is None:
+            connection = duckdb.connect()
+            if threads is not None:
+                connection.execute("SET threads TO {}".format(int(threads)))
+            # Bound to the store's current build, a re-ingest links a new one in without moving these files,
+            # and leaves the build in place for as long as this and its narrowed backends hold its lock
+            build, build_lock = hold_build(store)
+            files = os.path.join(build, "**", "*.parquet").replace("'", "''")
+            connection.execute("CREATE VIEW trips AS SELECT * FROM read_parquet('{}', hive_partitioning = true, hive_types = {{'Month': VARCHAR}})".format(files))
+
+        self.store = store
+        self.connection = connection
+        self.where = tuple(where)
+        self.parameters = tuple(parameters)
+        self.company_names = None
+        self.build_lock = build_lock
+
+    def narrow(self, where, parameters):
+        return DuckDBBackend(self.store, connection=self.connection, where=self.where + (where,), parameters=self.parameters + tuple(parameters), build_lock=self.build_lock)
+
+    def filter(self, start_date, end_date, company=None):
+        start = pd.Timestamp(start_date)
+        end = pd.Timestamp(end_date) + pd.Timedelta(days=1)
+        selection = self.narrow('"Month" BETWEEN ? AND ? AND "Date" >= ? AND "Date" < ?', [start.strftime("%Y-%m"), end.strftime("%Y-%m"), start.to_pydatetime(), end.to_pydatetime()])
+        if company is not None:
+            selection = selection.narrow('"Company" = ?', [company])
+
+        return selection
+
+    def filter_companies(self, companies):
+        companies = list(companies)
+
+        return self.narrow('"Company" IN ({})'.format(", ".join("?" * len(companies)) or "NULL"), companies)
+
+    def query(self, sql, parameters=()):
+        # A cursor per query, the chart datasets are computed from several threads at once
+        where = " WHERE " + " AND ".join(self.where) if self.where else ""
+
+        return self.connection.cursor().execute(sql.format(where=where), list(self.parameters) + list(parameters)).df()
+
+    def aggregate(self, keys, values):
+        selected = [quote(key) for key in keys] + ["{} AS {}".format(aggregate(value), quote(value)) for value in values]
+        group_by = " GROUP BY " + ", ".join(quote(key) for key in keys) if keys else ""
+        cells = self.query("SELECT " + ", ".join(selected) + " FROM trips{where}" + group_by)
+
+        for key in keys:
+            if key == "Weekday":
+                cells[key] = pd.Categorical(cells[key], categories=WEEKDAYS)
+            elif key in ("Company", "Payment Type"):
+                cells[key] = cells[key].astype("category")
+
+        return cells
+
+    def companies(self):
+        # The store only changes by being re-ingested under a new backend, so a selection scans it once,
+        # and the company list every rerun asks the whole store for comes for free
+        if self.company_names is None:
+            self.company_names = list(self.query('SELECT DISTINCT "Company" FROM trips{where} ORDER BY "Company"')["Company"].dropna())
+
+        return list(self.company_names)
+
+    def totals(self):
+        cells = self.aggregate([], CUBE_VALUES)
+
+        # Sums over no rows are NULL in SQL and 0 in pandas
+        return {column: 0 if pd.isna(cells[column].iloc[0]) else cells[column].iloc[0] for column in cells.columns}
+
+    def rollup(self, keys, columns=("size",), means=()):
+        summed = list(columns) + [value for metric in means for value in (metric, metric + " count") if value not in columns]
+
+        return rollup(self.aggregate(keys, summed), keys, columns=columns, means=means)
+
+    def location_stats(self, cell_shape=None, cell_size=None):
+        cells = self.aggregate(["latitude", "longitude"], ["size"] + [value for metric in LOCATION_MEANS for value in (metric, metric + " count")])
+
+        return location_stats(bin_cube(cells, cell_shape, cell_size))
+
+    def location_mode(self, column, cell_shape=None, cell_size=None):
+        return location_mode(bin_cube(self.aggregate(["latitude", "longitude", column], ["size"]), cell_shape, cell_size), column)
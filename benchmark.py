@@ -0,0 +1,472 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import glob
+import io
+import os
+import pickle
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from backends import DuckDBBackend, PandasBackend
+from cache import cache_paths, read_cache, refresh_cache, write_cache
+from ingest import ingest_trips
+from parallel import compute_in_order
+from sampling import StratifiedSampler
+from synthetic import COMPANIES, make_trips, write_trips
+from cube import CUBE_KEYS, CUBE_METRICS, LOCATION_MEANS, build_cube, location_mode, location_stats, mean, rollup
+from trips import COMPANY_NAMES, PAYMENT_COLORS, TIMESTAMP_FORMAT, WEEKDAY_COLORS, bytes_per_row, filter_date_range, load_trips
+
+def load_synthetic_trips(rows):
+    buffer = io.StringIO()
+    make_trips(rows).to_csv(buffer, index=False)
+    buffer.seek(0)
+
+    return load_trips(buffer)
+
+def legacy_load(source):
+    data = pd.read_csv(source)
+    data = data.rename(columns={"Pickup Centroid Latitude": "latitude", "Pickup Centroid Longitude": "longitude"})
+
+    for old_name, new_name in COMPANY_NAMES.items():
+        data.loc[data["Company"] == old_name, "Company"] = new_name
+
+    data["Weekday"] = data.apply(lambda row: datetime.datetime.strptime(row["Trip Start Timestamp"], TIMESTAMP_FORMAT).strftime("%A"), 1)
+
+    return data
+
+def measure(function, *args):
+    # Timed and traced separately, tracemalloc slows allocation-heavy code down a lot
+    started = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return result, elapsed, peak
+
+def bench_load(sizes):
+    print("{:>10} {:>12} {:>12} {:>14} {:>14}".format("rows", "legacy s", "typed s", "legacy MiB", "typed MiB"))
+
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in sizes:
+            path = os.path.join(directory, "trips-{}.csv".format(rows))
+            make_trips(rows).to_csv(path, index=False)
+
+            legacy, legacy_time, legacy_peak = measure(legacy_load, path)
+            typed, typed_time, typed_peak = measure(load_trips, path)
+
+            weekdays = typed.set_index("Trip ID")["Weekday"].astype(str)
+            assert (weekdays[legacy["Trip ID"]].to_numpy() == legacy["Weekday"].to_numpy()).all()
+
+            print("{:>10} {:>12.2f} {:>12.2f} {:>14.1f} {:>14.1f}".format(rows, legacy_time, typed_time, legacy_peak / 2**20, typed_peak / 2**20))
+
+def mask_filter(data, start_date, end_date):
+    start = data["Trip Start Timestamp"]
+
+    return data[(start >= pd.Timestamp(start_date)) & (start < pd.Timestamp(end_date) + pd.Timedelta(days=1))]
+
+def bench_filter(sizes, repeat=20):
+    ranges = [
+        (datetime.date(2024, 1, 1), datetime.date(2024, 3, 1)),
+        (datetime.date(2024, 1, 31), datetime.date(2024, 2, 1)),
+        (datetime.date(2024, 2, 10), datetime.date(2024, 2, 10)),
+        (datetime.date(2023, 12, 1), datetime.date(2023, 12, 31)),
+    ]
+
+    print("{:>10} {:>12} {:>12}".format("rows", "mask ms", "slice ms"))
+
+    for rows in sizes:
+        data = load_synthetic_trips(rows)
+
+        for start_date, end_date in ranges:
+            expected = mask_filter(data, start_date, end_date)
+            pd.testing.assert_frame_equal(filter_date_range(data, start_date, end_date), expected)
+
+        timings = []
+        for function in (mask_filter, filter_date_range):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                function(data, *ranges[0])
+            timings.append((time.perf_counter() - started) / repeat * 1000)
+
+        print("{:>10} {:>12.2f} {:>12.2f}".format(rows, *timings))
+
+def bench_cube(sizes, repeat=5):
+    keys = [["Company"], ["Weekday"], ["Payment Type"], ["latitude", "longitude"]]
+
+    print("{:>10} {:>10} {:>12} {:>12} {:>12}".format("rows", "cells", "build s", "trips ms", "cube ms"))
+
+    for rows in sizes:
+        data = load_synthetic_trips(rows)
+
+        started = time.perf_counter()
+        cube = build_cube(data)
+        build_time = time.perf_counter() - started
+
+        timings = []
+        for function in (lambda key: data.groupby(key, observed=True)["Fare"].mean(), lambda key: rollup(cube, key, columns=[], means=["Fare"])):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                for key in keys:
+                    function(key)
+            timings.append((time.perf_counter() - started) / repeat * 1000)
+
+        print("{:>10} {:>10} {:>12.2f} {:>12.2f} {:>12.2f}".format(rows, len(cube), build_time, *timings))
+
+def legacy_mode(data, column, colors):
+    modes = data.groupby(["latitude", "longitude"], as_index=False)[column].agg(pd.Series.mode)
+    modes[column] = modes[column].map(lambda val : val if(isinstance(val, str)) else val[0])
+    modes["color"] = modes.apply(lambda row: colors[row[column]], 1)
+
+    return modes
+
+def cube_mode(cube, column, colors):
+    modes = location_mode(cube, column)
+    modes["color"] = modes[column].map(colors).astype(str)
+
+    return modes
+
+def bench_mode(sizes, repeat=3):
+    print("{:>10} {:>12} {:>12}".format("rows", "legacy ms", "cube ms"))
+
+    for rows in sizes:
+        data = load_synthetic_trips(rows)
+        # The legacy path ran on object columns
+        legacy_data = data.astype({"Payment Type": str, "Weekday": str})
+        cube = build_cube(data)
+
+        # Weekday ties have to go to the first name alphabetically, as they did, not to the first weekday
+        for column, colors in (("Payment Type", PAYMENT_COLORS), ("Weekday", WEEKDAY_COLORS)):
+            expected = legacy_mode(legacy_data, column, colors)
+            pd.testing.assert_frame_equal(cube_mode(cube, column, colors).astype({column: str}), expected)
+
+        timings = []
+        for function, frame in ((legacy_mode, legacy_data), (cube_mode, cube)):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                function(frame, "Payment Type", PAYMENT_COLORS)
+            timings.append((time.perf_counter() - started) / repeat * 1000)
+
+        print("{:>10} {:>12.2f} {:>12.2f}".format(rows, *timings))
+
+def separate_location_stats(cube):
+    return [rollup(cube, ["latitude", "longitude"])] + [rollup(cube, ["latitude", "longitude"], columns=[], means=[metric]) for metric in LOCATION_MEANS]
+
+def bench_locations(sizes, repeat=5):
+    print("{:>10} {:>14} {:>12}".format("rows", "separate ms", "fused ms"))
+
+    for rows in sizes:
+        cube = build_cube(load_synthetic_trips(rows))
+
+        fused = location_stats(cube)
+        for separate in separate_location_stats(cube):
+            pd.testing.assert_frame_equal(fused[separate.columns], separate)
+
+        timings = []
+        for function in (separate_location_stats, location_stats):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                function(cube)
+            timings.append((time.perf_counter() - started) / repeat * 1000)
+
+        print("{:>10} {:>14.2f} {:>12.2f}".format(rows, *timings))
+
+def bench_ingest(sizes, chunk_size=100_000):
+    print("{:>10} {:>10} {:>12} {:>12} {:>14} {:>14}".format("rows", "cells", "full s", "chunked s", "full MiB", "chunked MiB"))
+
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in sizes:
+            path = os.path.join(directory, "trips-{}.csv".format(rows))
+            make_trips(rows).to_csv(path, index=False)
+
+            full, full_time, full_peak = measure(lambda: build_cube(load_trips(path)))
+            chunked, chunked_time, chunked_peak = measure(lambda: ingest_trips(path, chunk_size))
+            assert full["size"].sum() == chunked["size"].sum() == rows
+
+            print("{:>10} {:>10} {:>12.2f} {:>12.2f} {:>14.1f} {:>14.1f}".format(rows, len(chunked), full_time, chunked_time, full_peak / 2**20, chunked_peak / 2**20))
+
+def chart_tasks(cube):
+    # The Compare companies and Weekdays datasets
+    return [lambda keys=keys, columns=columns, means=means: rollup(cube, keys, columns=columns, means=means) for keys in (["Company"], ["Weekday"], ["Weekday", "Company"], ["Weekday", "Payment Type"]) for columns, means in ((["size"], []), (["Trip Total"], []), ([], ["Fare"]), ([], ["Tips"]), ([], ["Trip Seconds"]), ([], ["Trip Miles"]))] + [lambda: location_mode(cube, "Weekday")]
+
+def bench_parallel(sizes, workers, repeat=5):
+    print("{:>10} {:>12} {:>14}".format("rows", "serial ms", "{} threads ms".format(workers)))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for rows in sizes:
+            cube = build_cube(load_synthetic_trips(rows))
+            tasks = chart_tasks(cube)
+
+            for serial, parallel in zip([task() for task in tasks], compute_in_order(executor, tasks)):
+                pd.testing.assert_frame_equal(serial, parallel)
+
+            timings = []
+            for function in (lambda: [task() for task in tasks], lambda: list(compute_in_order(executor, tasks))):
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    function()
+                timings.append((time.perf_counter() - started) / repeat * 1000)
+
+            print("{:>10} {:>12.2f} {:>14.2f}".format(rows, *timings))
+
+def allocated(function, *args):
+    # Arrow's allocator is invisible to tracemalloc, so its bytes are counted separately
+    arrow_before = pa.total_allocated_bytes()
+    tracemalloc.start()
+    result = function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return result, peak + pa.total_allocated_bytes() - arrow_before
+
+def bench_sessions(sizes, sessions=8):
+    # What each extra session or server process pays for the cube: an unpickled copy from st.cache_data,
+    # or a read of the memory-mapped cache file, a shared st.cache_resource object costs nothing
+    print("{:>10} {:>12} {:>18} {:>16} {:>21}".format("rows", "cube MiB", "pickled MiB/each", "first mmap MiB", "next mmaps KiB/each"))
+
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in sizes:
+            cube = build_cube(load_synthetic_trips(rows))
+            cube_bytes = cube.memory_usage(deep=True).sum()
+            path = os.path.join(directory, "cube-{}.feather".format(rows))
+            write_cache(cube, path)
+            pickled = pickle.dumps(cube)
+
+            _, pickled_bytes = allocated(lambda: [pickle.loads(pickled) for _ in range(sessions)])
+            mapped, first_bytes = allocated(read_cache, path)
+            pd.testing.assert_frame_equal(mapped, cube)
+
+            # Every session after the first maps the same pages, only the frame's own bookkeeping is new
+            _, mapped_bytes = allocated(lambda: [read_cache(path) for _ in range(sessions)])
+            extra_bytes = (mapped_bytes - first_bytes) / (sessions - 1)
+            assert extra_bytes < 2**18 + cube_bytes / 100, "each extra session copies {:.1f} MiB".format(extra_bytes / 2**20)
+
+            print("{:>10} {:>12.1f} {:>18.1f} {:>16.1f} {:>21.1f}".format(rows, cube_bytes / 2**20, pickled_bytes / sessions / 2**20, first_bytes / 2**20, extra_bytes / 2**10))
+
+def backend_queries(backend):
+    # Every query the dashboard sends, on a date range that cuts through the synthetic months,
+    # and on one before the first trip
+    trips = backend.filter(datetime.date(2024, 1, 10), datetime.date(2024, 2, 5))
+    empty = backend.filter(datetime.date(2023, 12, 1), datetime.date(2023, 12, 31))
+
+    return [
+        lambda: pd.DataFrame([trips.totals()]),
+        lambda: pd.DataFrame({"Company": trips.companies()}),
+        lambda: trips.filter_companies(COMPANIES[:3]).rollup(["Weekday", "Company"], columns=["size", "Trip Total"]),
+        lambda: trips.location_stats(),
+        lambda: trips.location_stats("Hexagons", 500),
+        lambda: trips.location_mode("Payment Type", "Squares", 1000),
+        lambda: backend.filter(datetime.date(2024, 1, 1), datetime.date(2024, 3, 1), "Flash Cab").location_mode("Weekday"),
+        lambda: pd.DataFrame([empty.totals()]),
+        lambda: pd.DataFrame({"Company": empty.companies()}),
+        lambda: empty.location_stats("Hexagons", 500),
+        lambda: empty.location_mode("Payment Type"),
+        lambda: empty.location_mode("Weekday", "Squares", 1000),
+    ] + [lambda keys=keys, means=means, selection=selection: selection.rollup(keys, columns=["size"], means=means) for selection in (trips, empty) for keys in (["Company"], ["Weekday"], ["Weekday", "Payment Type"]) for means in ([], LOCATION_MEANS)]
+
+def bench_backends(sizes, chunk_size=100_000, repeat=3):
+    print("{:>10} {:>12} {:>12}".format("rows", "pandas ms", "duckdb ms"))
+
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in sizes:
+            path = os.path.join(directory, "trips-{}.csv".format(rows))
+            store = os.path.join(directory, "store-{}".format(rows))
+            make_trips(rows).to_csv(path, index=False)
+
+            # The pandas backend is the reference, the engine has to agree with it up to summation order
+            pandas_queries = backend_queries(PandasBackend(ingest_trips(path, chunk_size, store)))
+            duckdb_queries = backend_queries(DuckDBBackend(store))
+            for expected, actual in zip(pandas_queries, duckdb_queries):
+                pd.testing.assert_frame_equal(expected(), actual(), check_dtype=False, check_categorical=False)
+
+            # A backend outlives any number of re-ingests. Only the build in between, which nothing reads, is removed
+            backend = DuckDBBackend(store)
+            for _ in range(2):
+                ingest_trips(path, chunk_size, store)
+            for expected, actual in zip(pandas_queries, backend_queries(backend)):
+                pd.testing.assert_frame_equal(expected(), actual(), check_dtype=False, check_categorical=False)
+            assert len(glob.glob(store + ".build-*")) == 2
+
+            timings = []
+            for queries in (pandas_queries, duckdb_queries):
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    for query in queries:
+                        query()
+                timings.append((time.perf_counter() - started) / repeat * 1000)
+
+            print("{:>10} {:>12.2f} {:>12.2f}".format(rows, *timings))
+
+def run_queries(queries):
+    return [query() for query in queries]
+
+def bench_pipeline(sizes, chunk_size=1_000_000):
+    # The whole headless path at scale: streaming the CSV into the cube, then every dashboard query on it
+    print("{:>10} {:>10} {:>10} {:>12} {:>12} {:>12} {:>12}".format("rows", "CSV MiB", "ingest s", "rows/s", "ingest MiB", "queries ms", "query MiB"))
+
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in sizes:
+            path = os.path.join(directory, "trips-{}.csv".format(rows))
+            write_trips(path, rows, chunk_size)
+
+            cube, ingest_time, ingest_peak = measure(ingest_trips, path, chunk_size)
+            assert cube["size"].sum() == rows
+            _, query_time, query_peak = measure(run_queries, backend_queries(PandasBackend(cube)))
+
+            print("{:>10} {:>10.1f} {:>10.2f} {:>12,.0f} {:>12.1f} {:>12.2f} {:>12.1f}".format(rows, os.path.getsize(path) / 2**20, ingest_time, rows / ingest_time, ingest_peak / 2**20, query_time * 1000, query_peak / 2**20))
+            os.remove(path)
+
+def bench_compact(sizes):
+    print("{:>10} {:>12} {:>14} {:>10} {:>12} {:>12} {:>14}".format("rows", "full B/row", "compact B/row", "full s", "compact s", "full MiB", "compact MiB"))
+
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in sizes:
+            path = os.path.join(directory, "trips-{}.csv".format(rows))
+            write_trips(path, rows)
+
+            full, full_time, full_peak = measure(load_trips, path)
+            compact, compact_time, compact_peak = measure(lambda: load_trips(path, compact=True))
+
+            # float32 moves values by less than a cent or a meter, every rollup agrees to float32 precision
+            full_cube, compact_cube = PandasBackend(build_cube(full)), PandasBackend(build_cube(compact))
+            for keys in (["Company"], ["Weekday"], ["Payment Type"]):
+                pd.testing.assert_frame_equal(full_cube.rollup(keys, columns=["size", "Trip Total"], means=LOCATION_MEANS), compact_cube.rollup(keys, columns=["size", "Trip Total"], means=LOCATION_MEANS), rtol=1e-6)
+            # Centroids whose latitudes round to the same float32 sort differently, so both are ordered by the rounded keys
+            full_stats, compact_stats = (stats.astype({"latitude": "float32", "longitude": "float32"}).sort_values(["latitude", "longitude"], ignore_index=True) for stats in (full_cube.location_stats(), compact_cube.location_stats()))
+            pd.testing.assert_frame_equal(full_stats, compact_stats, rtol=1e-6)
+
+            print("{:>10} {:>12.1f} {:>14.1f} {:>10.2f} {:>12.2f} {:>12.1f} {:>14.1f}".format(rows, bytes_per_row(full), bytes_per_row(compact), full_time, compact_time, full_peak / 2**20, compact_peak / 2**20))
+
+def sampled_queries(backend):
+    # The metrics and company charts, the queries the sample answers first
+    trips = backend.filter(datetime.date(2024, 1, 10), datetime.date(2024, 2, 5))
+
+    return [trips.totals, lambda: trips.rollup(["Company"], columns=["size", "Trip Total"], means=LOCATION_MEANS)]
+
+def bench_sampling(sizes, per_stratum=50, repeat=5):
+    print("{:>10} {:>10} {:>12} {:>12} {:>12} {:>12}".format("rows", "sampled", "exact ms", "sampled ms", "fare error", "covered"))
+
+    for rows in sizes:
+        data = load_synthetic_trips(rows)
+        exact = PandasBackend(build_cube(data))
+
+        # A sample holding every trip gives the exact values, with no error
+        sampler = StratifiedSampler(rows)
+        sampler.add(data)
+        complete = sampler.backend().filter(datetime.date(2024, 1, 10), datetime.date(2024, 2, 5)).totals()
+        expected = exact.filter(datetime.date(2024, 1, 10), datetime.date(2024, 2, 5)).totals()
+        for metric in CUBE_METRICS:
+            assert np.isclose(complete[metric], expected[metric]) and complete[metric + " error"] == 0
+
+        sampler = StratifiedSampler(per_stratum)
+        sampler.add(data)
+        sample = sampler.backend()
+        values = sample.filter(datetime.date(2024, 1, 10), datetime.date(2024, 2, 5)).totals()
+        covered = np.mean([abs(mean(values, metric) - mean(expected, metric)) <= values[metric + " mean error"] for metric in CUBE_METRICS])
+
+        timings = []
+        for queries in (sampled_queries(exact), sampled_queries(sample)):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                for query in queries:
+                    query()
+            timings.append((time.perf_counter() - started) / repeat * 1000)
+
+        print("{:>10} {:>10} {:>12.2f} {:>12.2f} {:>11.2%} {:>12.0%}".format(rows, sample.strata["sampled"].sum(), *timings, values["Fare mean error"] / mean(values, "Fare"), covered))
+
+def append_rows(path, rows):
+    rows.to_csv(path, mode="a", header=False, index=False)
+
+def refresh_steps(trips, rows):
+    # Each step changes the source the way the city's export does, or the way a reader can catch it
+    appended = make_trips(rows // 10, offset=rows)
+    corrections = trips.sample(20, random_state=0).assign(Fare=lambda data: data["Fare"] + 1)
+    line = appended.iloc[:1].to_csv(header=False, index=False)
+
+    return [
+        ("append", lambda path: append_rows(path, appended)),
+        # A trip corrected twice in one refresh keeps its last version
+        ("corrections", lambda path: append_rows(path, pd.concat([corrections, corrections.iloc[:5].assign(Fare=lambda data: data["Fare"] + 1)]))),
+        # Trip IDs below 0xa are all digits, and a block of only those must still match the cached IDs
+        ("digit IDs", lambda path: append_rows(path, trips.iloc[:10].assign(Tips=lambda data: data["Tips"] + 1))),
+        ("partial line", lambda path: open(path, "a").write(line[:len(line) // 2])),
+        ("rest of line", lambda path: open(path, "a").write(line[len(line) // 2:])),
+        # Anything but an append rebuilds the cache
+        ("rewrite", lambda path: trips.to_csv(path, index=False)),
+    ]
+
+def sorted_cube(cube):
+    keys = cube[CUBE_KEYS].astype({"Weekday": str, "Company": str, "Payment Type": str})
+
+    return cube.assign(**keys).sort_values(CUBE_KEYS, ignore_index=True)
+
+def bench_refresh(sizes, chunk_size=1000):
+    # An incremental refresh has to end up where a rebuild of the same source does, and so does chunked ingestion
+    print("{:>10} {:>14} {:>8} {:>14} {:>12}".format("rows", "step", "compact", "refresh ms", "rebuild ms"))
+
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in sizes:
+            trips = make_trips(rows)
+
+            for compact in (False, True):
+                path = os.path.join(directory, "trips-{}-{}.csv".format(rows, compact))
+                trips.to_csv(path, index=False)
+                cache_dir = os.path.join(directory, "cache-{}-{}".format(rows, compact))
+                refresh_cache(path, cache_dir, compact)
+
+                for step, (name, change) in enumerate(refresh_steps(trips, rows)):
+                    change(path)
+                    refresh_time = measure(refresh_cache, path, cache_dir, compact)[1]
+                    rebuild_dir = os.path.join(directory, "rebuild-{}-{}-{}".format(rows, compact, step))
+                    rebuild_time = measure(refresh_cache, path, rebuild_dir, compact)[1]
+
+                    (trips_path, cube_path, _), (rebuilt_path, rebuilt_cube_path, _) = cache_paths(path, cache_dir), cache_paths(path, rebuild_dir)
+                    refreshed, rebuilt = (read_cache(trips_path, compact).sort_values("Trip ID", ignore_index=True), read_cache(rebuilt_path, compact).sort_values("Trip ID", ignore_index=True))
+                    pd.testing.assert_frame_equal(refreshed, rebuilt, check_categorical=False)
+
+                    expected = sorted_cube(read_cache(rebuilt_cube_path))
+                    pd.testing.assert_frame_equal(sorted_cube(read_cache(cube_path)), expected, check_dtype=False)
+                    # Chunked ingestion streams the source as it is, half a line included
+                    if name != "partial line":
+                        pd.testing.assert_frame_equal(sorted_cube(ingest_trips(path, chunk_size, compact=compact)), expected, check_dtype=False)
+
+                    print("{:>10} {:>14} {:>8} {:>14.2f} {:>12.2f}".format(rows, name, str(compact), refresh_time * 1000, rebuild_time * 1000))
+
+BENCHMARKS = {
+    "load": bench_load,
+    "filter": bench_filter,
+    "cube": bench_cube,
+    "mode": bench_mode,
+    "locations": bench_locations,
+    "ingest": bench_ingest,
+    "parallel": bench_parallel,
+    "sessions": bench_sessions,
+    "backends": bench_backends,
+    "pipeline": bench_pipeline,
+    "compact": bench_compact,
+    "sampling": bench_sampling,
+    "refresh": bench_refresh,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 500_000])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    args = parser.parse_args()
+
+    for name in args.benchmarks:
+        print(name)
+        if name == "parallel":
+            bench_parallel(args.rows, args.workers)
+        else:
+            BENCHMARKS[name](args.rows)
@@ -0,0 +1,230 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import requests
+
+from cube import build_cube, update_cube
+from locks import lock, unlock
+from trips import bytes_per_row, concat_frames, drop_corrections, load_trips, normalize_trips, read_trips
+
+# Bumped whenever normalize_trips or build_cube change what ends up in the cache
+CACHE_VERSION = 5
+
+# How much of the already-cached source is re-read to check that it was only appended to
+TAIL_BYTES = 65536
+
+# How much of the source is parsed with the full schema to compare the compact one's bytes per row with
+SAMPLE_BYTES = 1048576
+
+logger = logging.getLogger(__name__)
+if not logger.handlers:
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+
+def is_url(source):
+    return source.startswith(("http://", "https://"))
+
+def source_fingerprint(source):
+    if is_url(source):
+        response = requests.head(source, allow_redirects=True, timeout=10)
+        response.raise_for_status()
+
+        return response.headers.get("ETag") or response.headers.get("Last-Modified")
+
+    stat = os.stat(source)
+
+    return "{}-{}".format(stat.st_size, stat.st_mtime_ns)
+
+def read_source(source, start=0):
+    if is_url(source):
+        response = requests.get(source, headers={"Range": "bytes={}-".format(start)} if start else {}, timeout=60)
+        # Nothing past the end, the source shrank
+        if response.status_code == 416:
+            return b""
+        response.raise_for_status()
+
+        # Servers that ignore ranges send the whole file
+        return response.content if response.status_code == 206 else response.content[start:]
+
+    with open(source, "rb") as file:
+        file.seek(start)
+        return file.read()
+
+def cache_paths(source, cache_dir):
+    name = hashlib.sha1(source.encode()).hexdigest()[:16]
+
+    return os.path.join(cache_dir, name + ".feather"), os.path.join(cache_dir, name + ".cube.feather"), os.path.join(cache_dir, name + ".json")
+
+def read_metadata(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def read_cache(path, compact=False):
+    # Uncompressed single-chunk feather files are memory-mapped, and with one block per column
+    # the numeric columns stay read-only views on the page cache that every process shares.
+    # Compact trip IDs are kept as Arrow strings instead of turning into Python objects
+    # (pandas writes them as large strings, which concatenation can turn into plain ones)
+    types_mapper = {pa.string(): pd.StringDtype("pyarrow"), pa.large_string(): pd.StringDtype("pyarrow")}.get if compact else None
+
+    return feather.read_table(path, memory_map=True).to_pandas(split_blocks=True, types_mapper=types_mapper)
+
+@contextmanager
+def replacing(path):
+    # Written under a temporary name of its own first, so a concurrent reader never sees a partial file
+    # and two writers never share one
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".tmp")
+    os.close(descriptor)
+    # mkstemp makes the file private, the cache is read by every server process
+    os.chmod(temporary, 0o644)
+    try:
+        yield temporary
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+def write_cache(data, path):
+    # Arrow turns NaN into nulls, and a float column with nulls is copied to put the NaN back on every read,
+    # so float columns keep their NaN as plain values and stay views on the mapped file
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    for index, field in enumerate(table.schema):
+        if pa.types.is_floating(field.type) and table.column(index).null_count:
+            table = table.set_column(index, field, pa.array(data[field.name].to_numpy(), type=field.type, from_pandas=False))
+
+    # A single chunk per column, several would have to be concatenated into a copy when read
+    with replacing(path) as temporary:
+        feather.write_feather(table, temporary, compression="uncompressed", chunksize=max(len(data), 1))
+
+def write_metadata(metadata, path):
+    with replacing(path) as temporary:
+        with open(temporary, "w") as file:
+            json.dump(metadata, file)
+
+@contextmanager
+def cache_lock(source, cache_dir):
+    # The trips, cube and metadata are replaced one after the other, so server processes sharing the
+    # cache directory refresh and read them one at a time, and never pair new trips with an old cube
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.splitext(cache_paths(source, cache_dir)[2])[0] + ".lock", "w") as file:
+        lock(file)
+        try:
+            yield
+        finally:
+            unlock(file)
+
+def source_metadata(header, content, offset, fingerprint, high_water_mark, compact):
+    # content ends at offset, its last bytes are what the next refresh checks
+    return {
+        "version": CACHE_VERSION,
+        "compact": compact,
+        "fingerprint": fingerprint,
+        "header": header,
+        "offset": offset,
+        "tail_hash": hashlib.sha256(content[-TAIL_BYTES:]).hexdigest(),
+        "high_water_mark": str(high_water_mark),
+    }
+
+def append_trips(data, cube, new, high_water_mark):
+    # Rows already seen are late corrections, their old version is taken out of the trips and the cube
+    seen = data["Trip ID"].isin(new["Trip ID"])
+    removed = data[seen]
+    if len(removed):
+        data = data[~seen]
+
+    # Trips that all start after the high-water mark go at the end, anything earlier needs a re-sort
+    data = concat_frames([data, new])
+    if len(removed) or (len(new) and new["Trip Start Timestamp"].iloc[0] <= high_water_mark):
+        data = data.sort_values("Trip Start Timestamp", kind="stable", ignore_index=True)
+
+    return data, update_cube(cube, removed, new)
+
+def log_bytes_per_row(data, sample):
+    # The compact trip table's size, logged whenever it is written, next to the full schema's estimated from
+    # the first rows of the source or of what was appended
+    sample = sample[:sample.rfind(b"\n") + 1]
+    full = load_trips(io.BytesIO(sample))
+    logger.info(json.dumps({"rows": len(data), "bytes_per_row": round(bytes_per_row(data), 1), "full_bytes_per_row": round(bytes_per_row(full), 1)}))
+
+def update_cache(source, cache_dir, compact=False):
+    path, cube_path, metadata_path = cache_paths(source, cache_dir)
+    metadata = read_metadata(metadata_path)
+    # Switching between the full and the compact schema rebuilds the cache
+    cached = os.path.exists(path) and os.path.exists(cube_path) and metadata.get("version") == CACHE_VERSION and metadata.get("compact", False) == compact
+
+    try:
+        fingerprint = source_fingerprint(source)
+    except requests.RequestException:
+        # Offline, a stale cache is better than no dashboard
+        if cached:
+            return
+        raise
+
+    if cached and fingerprint is not None and metadata.get("fingerprint") == fingerprint:
+        return
+
+    if cached:
+        offset = metadata["offset"]
+        tail_start = max(0, offset - TAIL_BYTES)
+        content = read_source(source, tail_start)
+
+        # The source was only appended to, so only the new rows are parsed
+        if hashlib.sha256(content[:offset - tail_start]).hexdigest() == metadata["tail_hash"]:
+            # The source may be caught halfway through writing a line, which is left for the next refresh
+            appended = content[offset - tail_start:]
+            appended = appended[:appended.rfind(b"\n") + 1]
+            content = content[:offset - tail_start + len(appended)]
+            high_water_mark = pd.Timestamp(metadata["high_water_mark"])
+
+            if appended.strip():
+                # A correction appended twice in one refresh keeps its last version
+                new = drop_corrections(read_trips(io.BytesIO(metadata["header"].encode() + appended), compact=compact))
+                new = normalize_trips(new, compact=compact)
+                data, cube = append_trips(read_cache(path, compact), read_cache(cube_path), new, high_water_mark)
+                write_cache(data, path)
+                write_cache(cube, cube_path)
+                if compact:
+                    log_bytes_per_row(data, metadata["header"].encode() + appended[:SAMPLE_BYTES])
+                high_water_mark = max(high_water_mark, new["Trip Start Timestamp"].max())
+
+            write_metadata(source_metadata(metadata["header"], content, offset + len(appended), fingerprint, high_water_mark, compact), metadata_path)
+            return
+
+    # Likewise a last line without its newline waits, so the offset always falls on a line boundary
+    content = read_source(source)
+    content = content[:content.rfind(b"\n") + 1]
+    data = load_trips(io.BytesIO(content), compact=compact)
+    write_cache(data, path)
+    write_cache(build_cube(data), cube_path)
+    if compact:
+        log_bytes_per_row(data, content[:SAMPLE_BYTES])
+    header = content[:content.index(b"\n") + 1].decode()
+    write_metadata(source_metadata(header, content, len(content), fingerprint, data["Trip Start Timestamp"].max(), compact), metadata_path)
+
+def refresh_cache(source, cache_dir, compact=False):
+    with cache_lock(source, cache_dir):
+        update_cache(source, cache_dir, compact)
+
+def load_cached_trips(source, cache_dir, compact=False):
+    # Memory-mapped files stay readable after being replaced, so the lock is only held while opening them
+    with cache_lock(source, cache_dir):
+        update_cache(source, cache_dir, compact)
+
+        return read_cache(cache_paths(source, cache_dir)[0], compact)
+
+def load_cached_cube(source, cache_dir, compact=False):
+    with cache_lock(source, cache_dir):
+        update_cache(source, cache_dir, compact)
+
+        return read_cache(cache_paths(source, cache_dir)[1])
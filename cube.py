@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+from trips import concat_frames, filter_date_range
+
+CUBE_KEYS = ["Date", "Weekday", "Company", "Payment Type", "latitude", "longitude"]
+
+CUBE_METRICS = ["Fare", "Tips", "Trip Total", "Trip Seconds", "Trip Miles"]
+
+LOCATION_MEANS = ["Fare", "Tips", "Trip Seconds", "Trip Miles"]
+
+# Every column is additive, so any rollup of the cube is a plain sum over its cells
+CUBE_VALUES = ["size"] + CUBE_METRICS + [metric + " count" for metric in CUBE_METRICS] + [metric + " squares" for metric in CUBE_METRICS]
+
+def build_cube(data):
+    # Compact trips store the metrics as float32, their sums are taken in float64
+    cells = data[CUBE_KEYS + CUBE_METRICS].astype({metric: "float64" for metric in CUBE_METRICS})
+    for metric in CUBE_METRICS:
+        cells[metric + " squares"] = cells[metric] ** 2
+
+    grouped = cells.groupby(CUBE_KEYS, observed=True, dropna=False, sort=False)
+    cube = pd.concat([
+        grouped.size().rename("size"),
+        grouped[CUBE_METRICS + [metric + " squares" for metric in CUBE_METRICS]].sum(),
+        grouped[CUBE_METRICS].count().add_suffix(" count"),
+    ], axis=1)[CUBE_VALUES].reset_index()
+
+    # Sorted by day like the trips, so date ranges are sliced the same way
+    return cube.sort_values("Date", kind="stable", ignore_index=True)
+
+def merge_cubes(cubes):
+    cube = concat_frames(cubes).groupby(CUBE_KEYS, observed=True, dropna=False, sort=False)[CUBE_VALUES].sum().reset_index()
+
+    return cube.sort_values("Date", kind="stable", ignore_index=True)
+
+def update_cube(cube, removed, added):
+    # Additive cells make an update a merge with the removed trips counted negatively
+    removed_cube = build_cube(removed)
+    removed_cube[CUBE_VALUES] = -removed_cube[CUBE_VALUES]
+    cube = merge_cubes([cube, removed_cube, build_cube(added)])
+
+    return cube[cube["size"] != 0].reset_index(drop=True)
+
+def filter_cube(cube, start_date, end_date, company=None):
+    cube = filter_date_range(cube, start_date, end_date, column="Date")
+    if company is not None:
+        cube = cube[cube["Company"] == company]
+
+    return cube
+
+def rollup(cube, keys, columns=("size",), means=()):
+    summed = list(columns) + [value for metric in means for value in (metric, metric + " count") if value not in columns]
+    rolled = cube.groupby(keys, as_index=False, observed=True)[summed].sum()
+    for metric in means:
+        rolled[metric] = rolled[metric] / rolled[metric + " count"]
+
+    return rolled[list(keys) + list(columns) + list(means)]
+
+def totals(cube):
+    return {column: cube[column].sum() for column in CUBE_VALUES}
+
+def mean(values, metric):
+    return values[metric] / values[metric + " count"]
+
+def location_stats(cube):
+    return rollup(cube, ["latitude", "longitude"], means=LOCATION_MEANS)
+
+def location_mode(cube, column):
+    # Sorted by location then category code, so each location is a contiguous run of rows
+    counts = rollup(cube, ["latitude", "longitude", column])
+    latitude = counts["latitude"].to_numpy()
+    longitude = counts["longitude"].to_numpy()
+
+    new_location = np.ones(len(counts), dtype=bool)
+    new_location[1:] = (latitude[1:] != latitude[:-1]) | (longitude[1:] != longitude[:-1])
+    location = np.cumsum(new_location) - 1
+
+    # One row per location and one column per category, with the columns in name order: pd.Series.mode
+    # sorted its values, so ties went to the first name alphabetically, not to the first weekday
+    categories = counts[column].cat.categories
+    by_name = np.argsort(np.asarray(categories.astype(str)), kind="stable")
+    table = np.zeros((new_location.sum(), len(categories)), dtype=counts["size"].dtype)
+    table[location, np.argsort(by_name)[counts[column].cat.codes.to_numpy()]] = counts["size"].to_numpy()
+
+    return pd.DataFrame({
+        "latitude": latitude[new_location],
+        "longitude": longitude[new_location],
+        # An empty selection can have no categories at all, and argmax has nothing to pick from
+        column: pd.Categorical.from_codes(by_name[table.argmax(axis=1)] if len(table) else np.empty(0, dtype=int), categories=categories),
+    })
@@ -0,0 +1,196 @@
+import glob
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import requests
+
+from cache import is_url
+from cube import build_cube, merge_cubes, update_cube
+from locks import lock, unlock
+from trips import concat_frames, drop_corrections, normalize_trips, read_trips
+
+# Every build holds this file. Whoever reads a build keeps a shared lock on it, and a build is only removed
+# once nobody does
+BUILD_LOCK = "readers.lock"
+
+def open_source(source):
+    if is_url(source):
+        response = requests.get(source, stream=True, timeout=60)
+        response.raise_for_status()
+        response.raw.decode_content = True
+        size = response.headers.get("Content-Length")
+
+        return response.raw, int(size) if size else None
+
+    return open(source, "rb"), os.path.getsize(source)
+
+def write_partition(data, store, index):
+    # Every chunk's files are named after it, so a chunk can be rewritten on its own
+    data = data.assign(Month=data["Date"].dt.strftime("%Y-%m"))
+    pq.write_to_dataset(pa.Table.from_pandas(data, preserve_index=False), store, partition_cols=["Month"], basename_template="chunk-{}-{{i}}.parquet".format(index))
+
+def drop_from_partition(store, index, trip_ids):
+    # Trip IDs are unique within a chunk, so they pick out the stale rows
+    for path in glob.glob(os.path.join(store, "*", "chunk-{}-*.parquet".format(index))):
+        table = pq.read_table(path)
+        pq.write_table(table.filter(pc.invert(pc.is_in(table["Trip ID"], value_set=pa.array(trip_ids, pa.string())))), path)
+
+def new_build(store):
+    parent, name = os.path.split(os.path.abspath(store))
+    os.makedirs(parent, exist_ok=True)
+
+    build = tempfile.mkdtemp(dir=parent, prefix=name + ".build-")
+    # mkdtemp makes the directory private, the store is read by every server process
+    os.chmod(build, 0o755)
+    open(os.path.join(build, BUILD_LOCK), "w").close()
+
+    return build
+
+def hold_build(store):
+    # The store's current build and its lock file, locked shared until the file is closed. The build is
+    # resolved again if another ingestion removed it before the lock was taken
+    while True:
+        build = os.path.realpath(store)
+        try:
+            file = open(os.path.join(build, BUILD_LOCK))
+        except FileNotFoundError:
+            if not os.path.isdir(build):
+                if os.path.realpath(store) == build:
+                    raise
+                continue
+            # A store written before builds had lock files
+            return build, None
+
+        lock(file, shared=True)
+        if os.path.isdir(build):
+            return build, file
+        file.close()
+
+def rename_build(build, removed):
+    try:
+        os.rename(build, removed)
+        return True
+    except OSError:
+        return False
+
+def remove_build(build):
+    # Skipped while a reader holds the build. It is renamed away under the exclusive lock, so a reader that
+    # opened the lock file meanwhile finds the build gone once it gets its shared lock
+    removed = build + ".removed"
+    try:
+        file = open(os.path.join(build, BUILD_LOCK), "a")
+    except FileNotFoundError:
+        # Removed by another ingestion
+        return
+
+    with file:
+        if not lock(file, blocking=False):
+            return
+        renamed = rename_build(build, removed)
+        unlock(file)
+
+    if not renamed:
+        # Windows can't rename a directory with a file open in it, the lock file just closed included.
+        # Readers there keep the lock file open instead of locking it, so this only works once none does
+        renamed = rename_build(build, removed)
+
+    if renamed:
+        shutil.rmtree(removed, ignore_errors=True)
+
+def swap_store(store, build):
+    # The store is a link to its latest build. Replacing a link is atomic, so a query never finds the store
+    # missing, and the builds before stay for as long as a backend reads them
+    if os.path.isdir(store) and not os.path.islink(store):
+        # A store written before builds were linked, it can only be replaced by removing it first
+        shutil.rmtree(store)
+
+    link = build + ".link"
+    os.symlink(os.path.basename(build), link)
+    os.replace(link, store)
+
+    # Every other build goes unless it is locked: one a backend still queries, or another ingestion is writing
+    for path in glob.glob(os.path.abspath(store) + ".build-*"):
+        if path.endswith(".removed") and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif path != build and os.path.isdir(path) and not os.path.islink(path):
+            remove_build(path)
+
+def trip_id_hashes(data):
+    return pd.util.hash_pandas_object(data["Trip ID"], index=False).to_numpy()
+
+def read_stale_trips(source, chunk_size, hashes, compact=False):
+    # The rows sharing a hashed ID with another one, read again with the chunk they were in.
+    # Their IDs are compared for real here, so a hash collision can't drop a trip
+    repeated = pd.Series(hashes).duplicated(keep=False).to_numpy()
+    file, _ = open_source(source)
+    candidates = []
+
+    with file:
+        for index, chunk in enumerate(read_trips(file, chunk_size=chunk_size, compact=compact)):
+            candidates.append(chunk[repeated[chunk.index]].assign(chunk=index))
+
+    candidates = concat_frames(candidates)
+
+    # Stale rows are superseded by a later row, but weren't already dropped within their own chunk
+    stale = candidates.duplicated("Trip ID", keep="last") & ~candidates.duplicated(["chunk", "Trip ID"], keep="last")
+
+    return candidates[stale.to_numpy()]
+
+def ingest_trips(source, chunk_size, store=None, progress=None, merge_every=4, compact=False, sampler=None):
+    file, size = open_source(source)
+    rows = 0
+    cubes = []
+    hashes = []
+
+    # The store is built in a directory of its own and linked in at the end, so readers never see half of it.
+    # It is held like a reader's until then, so another ingestion finishing first leaves it alone
+    build = new_build(store) if store is not None else None
+    build_lock = open(os.path.join(build, BUILD_LOCK)) if build is not None else None
+    if build_lock is not None:
+        lock(build_lock, shared=True)
+
+    with file:
+        for index, chunk in enumerate(read_trips(file, chunk_size=chunk_size, compact=compact)):
+            hashes.append(trip_id_hashes(chunk))
+            chunk = normalize_trips(drop_corrections(chunk), compact=compact)
+            cubes.append(build_cube(chunk))
+            if sampler is not None:
+                sampler.add(chunk)
+            if store is not None:
+                write_partition(chunk, build, index)
+
+            # Chunk cubes are merged as they pile up, so memory follows the chunk size and the cube size only
+            if len(cubes) >= merge_every:
+                cubes = [merge_cubes(cubes)]
+
+            rows += len(chunk)
+            if progress is not None:
+                progress(rows, min(file.tell() / size, 1.0) if size else None)
+
+    cube = merge_cubes(cubes)
+
+    # A correction in a later chunk than its trip is only known once every ID was seen. IDs are kept as
+    # 8-byte hashes, and only when some repeat is the source read again to take the stale versions out
+    hashes = np.concatenate(hashes) if hashes else np.empty(0, dtype=np.uint64)
+    if pd.Series(hashes).duplicated().any():
+        stale = read_stale_trips(source, chunk_size, hashes, compact)
+        if len(stale):
+            removed = normalize_trips(stale.drop(columns="chunk"), compact=compact)
+            cube = update_cube(cube, removed, removed.iloc[:0])
+            if sampler is not None:
+                sampler.remove(removed)
+            if store is not None:
+                for index, trip_ids in stale.groupby("chunk")["Trip ID"]:
+                    drop_from_partition(build, index, list(trip_ids))
+
+    if store is not None:
+        swap_store(store, build)
+        build_lock.close()
+
+    return cube
@@ -0,0 +1,39 @@
+import time
+
+# flock on POSIX. Windows only has msvcrt's exclusive byte locks, there a shared holder is a plain open
+# handle instead, which keeps the file from being deleted until it is closed
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+def lock(file, shared=False, blocking=True):
+    # Returns whether the lock was taken, a blocking call always takes it
+    if fcntl is not None:
+        try:
+            fcntl.flock(file, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return False
+
+        return True
+
+    if shared:
+        return True
+
+    while True:
+        try:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            time.sleep(0.05)
+
+def unlock(file, shared=False):
+    if fcntl is not None:
+        fcntl.flock(file, fcntl.LOCK_UN)
+    elif not shared:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,21 @@
+class OrderedResults:
+    # Iterates over the tasks' results in task order. cancel() drops the tasks that haven't started,
+    # for a caller that stops before using them all
+    def __init__(self, futures):
+        self.futures = futures
+        self.results = (future.result() for future in futures)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.results)
+
+    def cancel(self):
+        for future in self.futures:
+            future.cancel()
+
+def compute_in_order(executor, tasks):
+    # Every task starts right away, results come back in task order so charts still render top to bottom
+    # (submitted here, not on the first next(), so they run while the caller draws something else)
+    return OrderedResults([executor.submit(task) for task in tasks])
@@ -0,0 +1,129 @@
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+import pyarrow as pa
+import pydeck as pdk
+
+# One JSON line per profiled rerun, on stderr next to Streamlit's own logs unless logging is configured otherwise
+logger = logging.getLogger(__name__)
+if not logger.handlers:
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+
+def output_rows(value):
+    if isinstance(value, pd.DataFrame):
+        return len(value)
+    # Decks hold their layers' data as lists of records, Altair charts keep the frame
+    if isinstance(value, pdk.Deck):
+        return sum(len(layer.data) for layer in value.layers if layer.data is not None)
+    if isinstance(getattr(value, "data", None), pd.DataFrame):
+        return len(value.data)
+
+    return None
+
+def payload_bytes(value):
+    # Frames go to the browser as Arrow IPC, charts and decks as their JSON spec with the data inlined
+    if isinstance(value, pd.DataFrame):
+        sink = pa.BufferOutputStream()
+        table = pa.Table.from_pandas(value, preserve_index=False)
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+
+        return sink.getvalue().size
+    if hasattr(value, "to_json"):
+        return len(value.to_json().encode())
+
+    return None
+
+class Section:
+    def __init__(self, name, enabled):
+        self.name = name
+        self.enabled = enabled
+        self.rows = None
+        self.payload_bytes = None
+
+    def output(self, value):
+        # Returns value, so the call wraps whatever is handed to Streamlit
+        if self.enabled:
+            self.rows = output_rows(value)
+            self.payload_bytes = payload_bytes(value)
+
+        return value
+
+# tracemalloc is process-wide, so it runs while any session's profiled rerun does and stops after the last one.
+# Tracing that something else started is left alone
+tracing_lock = threading.Lock()
+tracing_reruns = 0
+started_tracing = False
+
+def start_tracing():
+    global tracing_reruns, started_tracing
+
+    with tracing_lock:
+        if tracing_reruns == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+        tracing_reruns += 1
+
+def stop_tracing():
+    global tracing_reruns, started_tracing
+
+    with tracing_lock:
+        tracing_reruns -= 1
+        if tracing_reruns == 0 and started_tracing:
+            tracemalloc.stop()
+            started_tracing = False
+
+class Profiler:
+    # Records wall time, rows, peak memory and payload bytes per named section of a rerun, or nothing when disabled.
+    # The peak is process-wide too, sessions profiled at the same time add to each other's
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.records = []
+        self.tracing = False
+
+        if enabled:
+            start_tracing()
+            self.tracing = True
+
+    @contextmanager
+    def section(self, name):
+        section = Section(name, self.enabled)
+        if not self.enabled:
+            yield section
+            return
+
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        started = time.perf_counter()
+        try:
+            yield section
+        finally:
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            self.records.append({
+                "section": name,
+                "seconds": elapsed,
+                "rows": section.rows,
+                "peak_bytes": peak - current,
+                "payload_bytes": section.payload_bytes,
+            })
+
+    def finish(self):
+        # Tracing slows every allocation down, so it only runs while a profiled rerun does.
+        # Called once the rerun ends however it ends, a second call changes nothing
+        if self.tracing:
+            stop_tracing()
+            self.tracing = False
+
+        if self.enabled:
+            logger.info(json.dumps({"profile": self.records}))
+
+        records = pd.DataFrame(self.records, columns=["section", "seconds", "rows", "peak_bytes", "payload_bytes"])
+
+        return records.astype({"rows": "Int64", "payload_bytes": "Int64"})
@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+
+from cube import CUBE_KEYS, CUBE_METRICS, build_cube, filter_cube
+from trips import concat_frames, filter_date_range
+
+# Trips are sampled per company and day, every date range and company filter keeps whole strata
+STRATUM_KEYS = ["Date", "Company"]
+
+SAMPLED_COLUMNS = ["Trip ID"] + CUBE_KEYS + CUBE_METRICS
+
+# Half-width of a two-sided 95% interval, in standard errors
+Z_95 = 1.96
+
+class StratifiedSampler:
+    # Keeps the trips with the per_stratum smallest random keys of each stratum. The smallest keys of every
+    # chunk's smallest keys are the smallest keys overall, so chunks are sampled as they stream past
+    def __init__(self, per_stratum, seed=0, merge_every=4):
+        self.per_stratum = per_stratum
+        self.rng = np.random.default_rng(seed)
+        self.merge_every = merge_every
+        self.samples = []
+        self.populations = []
+
+    def smallest_keys(self, trips):
+        trips = trips.sort_values("key", kind="stable")
+
+        return trips[trips.groupby(STRATUM_KEYS, observed=True, dropna=False).cumcount() < self.per_stratum]
+
+    def add(self, data):
+        trips = data[SAMPLED_COLUMNS].assign(key=self.rng.random(len(data)))
+        self.samples.append(self.smallest_keys(trips))
+        self.populations.append(trips.groupby(STRATUM_KEYS, observed=True, dropna=False).size().rename("population").reset_index())
+
+        if len(self.samples) >= self.merge_every:
+            self.samples = [self.smallest_keys(concat_frames(self.samples))]
+            self.populations = [concat_frames(self.populations).groupby(STRATUM_KEYS, observed=True, dropna=False, as_index=False)["population"].sum()]
+
+    def remove(self, data):
+        # Superseded trips leave their strata, and the sample when they were drawn. What is left of a
+        # bottom-k sample is still a uniform sample of what is left of the stratum
+        sample = concat_frames(self.samples)
+        # Versions of a trip are told apart by their values, identical versions are interchangeable
+        sample = sample.assign(occurrence=sample.groupby(SAMPLED_COLUMNS, observed=True, dropna=False).cumcount())
+        removed = data[SAMPLED_COLUMNS].assign(occurrence=data.groupby(SAMPLED_COLUMNS, observed=True, dropna=False).cumcount(), removed=True)
+        kept = sample.merge(removed, on=SAMPLED_COLUMNS + ["occurrence"], how="left")["removed"].isna().to_numpy()
+        self.samples = [sample[kept].drop(columns="occurrence")]
+
+        populations = data.groupby(STRATUM_KEYS, observed=True, dropna=False).size().rename("population").reset_index()
+        self.populations.append(populations.assign(population=-populations["population"]))
+
+    def backend(self):
+        sample = self.smallest_keys(concat_frames(self.samples)).drop(columns="key")
+        strata = concat_frames(self.populations).groupby(STRATUM_KEYS, observed=True, dropna=False, as_index=False)["population"].sum()
+        strata = strata.merge(sample.groupby(STRATUM_KEYS, observed=True, dropna=False).size().rename("sampled").reset_index(), on=STRATUM_KEYS)
+
+        return SampleBackend(build_cube(sample), strata.sort_values("Date", kind="stable", ignore_index=True))
+
+def variance_terms(moments, sums, squares):
+    # Each stratum's share of the variance of an estimated total, from the sample's sums and squares
+    population = moments["population"].to_numpy()
+    sampled = moments["sampled"].to_numpy()
+    spread = np.where(sampled > 1, (squares - sums ** 2 / sampled) / np.maximum(sampled - 1, 1), 0.0)
+
+    return population ** 2 * (1 - sampled / population) * spread / sampled
+
+class SampleBackend:
+    # Estimates from a stratified sample of trips, for the queries whose groups never split a company's day:
+    # totals, and rollups by Date, Weekday or Company. Every value comes with the half-width of its 95% interval
+    def __init__(self, cube, strata):
+        self.cube = cube
+        self.strata = strata
+
+    def filter(self, start_date, end_date, company=None):
+        strata = filter_date_range(self.strata, start_date, end_date, column="Date")
+        if company is not None:
+            strata = strata[strata["Company"] == company]
+
+        return SampleBackend(filter_cube(self.cube, start_date, end_date, company), strata)
+
+    def filter_companies(self, companies):
+        return SampleBackend(self.cube[self.cube["Company"].isin(companies)], self.strata[self.strata["Company"].isin(companies)])
+
+    def companies(self):
+        return list(self.strata["Company"].dropna().sort_values().unique())
+
+    def estimate(self, keys, columns, means, mean_suffix=""):
+        # A metric can be both summed and averaged in one pass, with its mean and error named after mean_suffix
+        if not set(keys) <= {"Date", "Weekday", "Company"}:
+            raise ValueError("Sampled per company and day, {} can't be estimated".format(keys))
+
+        # Sample sums per stratum and group, next to the stratum's population and sample size
+        values = ["size"] + [value for metric in CUBE_METRICS for value in (metric, metric + " count", metric + " squares")]
+        moments = self.cube.groupby(STRATUM_KEYS + [key for key in keys if key not in STRATUM_KEYS], observed=True, dropna=False, as_index=False)[values].sum()
+        moments = moments.merge(self.strata, on=STRATUM_KEYS)
+        weights = (moments["population"] / moments["sampled"]).to_numpy()
+        estimates = moments[list(keys)].copy()
+
+        for column in columns:
+            sums = moments[column].to_numpy(dtype=float)
+            # The size of a group is the total of its indicator, which is its own square
+            squares = sums if column == "size" or column.endswith(" count") else moments[column + " squares"].to_numpy()
+            estimates[column] = weights * sums
+            estimates[column + " variance"] = variance_terms(moments, sums, squares)
+
+        # Means are ratios of two totals, their variance is linearized around the estimated ratio
+        for metric in means:
+            sums = moments[metric].to_numpy()
+            counts = moments[metric + " count"].to_numpy(dtype=float)
+            total = pd.Series(weights * sums).groupby([moments[key] for key in keys], observed=True).transform("sum") if keys else (weights * sums).sum()
+            count = pd.Series(weights * counts).groupby([moments[key] for key in keys], observed=True).transform("sum") if keys else (weights * counts).sum()
+            ratio = np.asarray(total / count)
+            residuals = sums - ratio * counts
+            residual_squares = moments[metric + " squares"].to_numpy() - 2 * ratio * sums + ratio ** 2 * counts
+            estimates[metric] = weights * sums
+            estimates[metric + " count"] = weights * counts
+            estimates[metric + " mean variance"] = variance_terms(moments, residuals, residual_squares) / np.asarray(count) ** 2
+
+        summed = [column for column in estimates.columns if column not in keys]
+        estimates = estimates.groupby(list(keys), observed=True)[summed].sum().reset_index() if keys else estimates[summed].sum().to_frame().T
+
+        for column in columns:
+            estimates[column + " error"] = Z_95 * np.sqrt(estimates[column + " variance"])
+        for metric in means:
+            estimates[metric + mean_suffix] = estimates[metric] / estimates[metric + " count"]
+            estimates[metric + mean_suffix + " error"] = Z_95 * np.sqrt(estimates[metric + " mean variance"])
+
+        averages = [metric + mean_suffix for metric in means]
+
+        return estimates[list(keys) + list(columns) + averages + [column + " error" for column in list(columns) + averages]]
+
+    def totals(self):
+        # Sums under the cube's names, so cube.mean works on them, plus the errors of the sums and of the means
+        counts = [metric + " count" for metric in CUBE_METRICS]
+        estimates = self.estimate([], ["size"] + CUBE_METRICS + counts, CUBE_METRICS, mean_suffix=" mean").iloc[0]
+
+        values = {"size": estimates["size"], "size error": estimates["size error"]}
+        for metric in CUBE_METRICS:
+            values[metric] = estimates[metric]
+            values[metric + " error"] = estimates[metric + " error"]
+            values[metric + " count"] = estimates[metric + " count"]
+            values[metric + " mean error"] = estimates[metric + " mean error"]
+
+        return values
+
+    def rollup(self, keys, columns=("size",), means=()):
+        return self.estimate(keys, columns, means)
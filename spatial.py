@@ -0,0 +1,51 @@
+import numpy as np
+
+# Degrees are turned into meters with an equirectangular projection around Chicago
+REFERENCE_LATITUDE = 41.88
+
+METERS_PER_DEGREE = 111320.0
+
+def cell_size_for_zoom(zoom, pixels):
+    # Web mercator ground resolution at the reference latitude, in meters per cell
+    return 156543.03 * np.cos(np.radians(REFERENCE_LATITUDE)) / 2 ** zoom * pixels
+
+def project(latitude, longitude):
+    return longitude * METERS_PER_DEGREE * np.cos(np.radians(REFERENCE_LATITUDE)), latitude * METERS_PER_DEGREE
+
+def unproject(x, y):
+    return y / METERS_PER_DEGREE, x / (METERS_PER_DEGREE * np.cos(np.radians(REFERENCE_LATITUDE)))
+
+def square_centers(latitude, longitude, size):
+    x, y = project(latitude, longitude)
+
+    return unproject((np.floor(x / size) + 0.5) * size, (np.floor(y / size) + 0.5) * size)
+
+def hexagon_centers(latitude, longitude, size):
+    # Pointy-top hexagons with a circumradius of size, in axial coordinates rounded through cube coordinates
+    x, y = project(latitude, longitude)
+    q = (np.sqrt(3) / 3 * x - y / 3) / size
+    r = 2 / 3 * y / size
+    s = -q - r
+
+    rounded_q, rounded_r, rounded_s = np.round(q), np.round(r), np.round(s)
+    error_q, error_r, error_s = np.abs(rounded_q - q), np.abs(rounded_r - r), np.abs(rounded_s - s)
+    fix_q = (error_q > error_r) & (error_q > error_s)
+    fix_r = ~fix_q & (error_r > error_s)
+    rounded_q = np.where(fix_q, -rounded_r - rounded_s, rounded_q)
+    rounded_r = np.where(fix_r, -rounded_q - rounded_s, rounded_r)
+
+    return unproject(size * np.sqrt(3) * (rounded_q + rounded_r / 2), size * 1.5 * rounded_r)
+
+CELL_SHAPES = {
+    "Hexagons": hexagon_centers,
+    "Squares": square_centers,
+}
+
+def bin_cube(cube, shape, size):
+    if shape is None:
+        return cube
+
+    # Snapping the cube's centroids to cell centers keeps it additive, so every location rollup works per cell
+    latitude, longitude = CELL_SHAPES[shape](cube["latitude"].to_numpy(), cube["longitude"].to_numpy(), size)
+
+    return cube.assign(latitude=latitude, longitude=longitude)
@@ -0,0 +1,150 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from trips import TIMESTAMP_FORMAT
+
+# Roughly the city's mix: a few large affiliations and a long tail, including names the dashboard renames
+COMPANIES = [
+    "Flash Cab",
+    "Taxi Affiliation Services",
+    "Taxi Affiliation Services Llc - Yell",
+    "Sun Taxi",
+    "City Service",
+    "Chicago Independents",
+    "Taxicab Insurance Agency Llc",
+    "Choice Taxi Association Inc",
+    "Blue Ribbon Taxi Association Inc.",
+    "5 Star Taxi",
+    "Medallion Leasin",
+    "Globe Taxi",
+    "Star North Management LLC",
+    "Top Cab Affiliation",
+    "Koam Taxi Association",
+    "Chicago Carriage Cab Corp",
+    "Patriot Taxi Dba Peace Taxi Associat",
+    "Setare Inc",
+    "Nova Taxi Affiliation Llc",
+    "Chicago Taxicab",
+]
+
+# Zipf-like market shares
+COMPANY_WEIGHTS = 1 / np.arange(1, len(COMPANIES) + 1) ** 1.1
+
+PAYMENT_TYPES = ["Cash", "Credit Card", "Dispute", "Mobile", "No Charge", "Prcard", "Unknown"]
+
+PAYMENT_WEIGHTS = [0.3, 0.45, 0.01, 0.12, 0.02, 0.05, 0.05]
+
+# Share of tips by payment type, cash tips mostly go unrecorded
+TIP_RATES = [0.01, 0.18, 0.0, 0.16, 0.0, 0.05, 0.02]
+
+# Relative demand per hour of the day, quiet before dawn and peaking with the commutes and evenings
+HOUR_WEIGHTS = [4, 3, 2, 1.5, 1, 1.5, 3, 6, 9, 8, 7, 7, 8, 8, 8, 9, 10, 11, 10, 9, 8, 7, 6, 5]
+
+# Sunday to Saturday
+WEEKDAY_WEIGHTS = [0.85, 0.9, 0.95, 1.0, 1.05, 1.2, 1.1]
+
+# The Loop and the two airports get most pickups, the rest spreads over the community area centroids
+HOTSPOTS = [
+    (41.8809, -87.6278, 0.25),
+    (41.9796, -87.9045, 0.12),
+    (41.7868, -87.7522, 0.05),
+    (41.8925, -87.6340, 0.10),
+    (41.8786, -87.6690, 0.05),
+]
+
+CENTROIDS = 800
+
+# Trips from outside the city have no pickup centroid
+MISSING_CENTROID_RATE = 0.03
+
+MISSING_METRIC_RATE = 0.005
+
+def make_centroids(count=CENTROIDS, seed=0):
+    # Fixed across chunks, so every chunk picks up at the same centroids
+    rng = np.random.default_rng(seed)
+    latitude = np.concatenate([[spot[0] for spot in HOTSPOTS], rng.uniform(41.65, 42.02, count - len(HOTSPOTS))]).round(9)
+    longitude = np.concatenate([[spot[1] for spot in HOTSPOTS], rng.uniform(-87.85, -87.53, count - len(HOTSPOTS))]).round(9)
+
+    # Popularity falls off with the distance from the Loop
+    distance = np.hypot(latitude[len(HOTSPOTS):] - HOTSPOTS[0][0], longitude[len(HOTSPOTS):] - HOTSPOTS[0][1])
+    tail = np.exp(-distance / 0.05)
+    hotspot_share = sum(spot[2] for spot in HOTSPOTS)
+    weights = np.concatenate([[spot[2] for spot in HOTSPOTS], tail / tail.sum() * (1 - hotspot_share)])
+
+    return latitude, longitude, weights
+
+def format_timestamps(timestamps):
+    # Timestamps are rounded to 15 minutes, so only the distinct ones are formatted
+    values, inverse = np.unique(timestamps.to_numpy(), return_inverse=True)
+
+    return pd.DatetimeIndex(values).strftime(TIMESTAMP_FORMAT).to_numpy()[inverse]
+
+def make_trips(rows, seed=0, start="2024-01-01", days=60, offset=0):
+    rng = np.random.default_rng([seed, offset])
+
+    # Busier weekdays get more trips, and each trip an hour from the daily profile
+    day_starts = pd.date_range(start, periods=days, freq="D")
+    day_weights = np.array(WEEKDAY_WEIGHTS)[(day_starts.dayofweek + 1) % 7]
+    day = rng.choice(days, rows, p=day_weights / day_weights.sum())
+    hour = rng.choice(24, rows, p=np.array(HOUR_WEIGHTS) / sum(HOUR_WEIGHTS))
+    quarter = rng.integers(0, 4, rows)
+    trip_start = day_starts[day] + pd.to_timedelta(hour * 60 + quarter * 15, unit="min")
+
+    latitude, longitude, weights = make_centroids()
+    centroid = rng.choice(len(weights), rows, p=weights)
+    missing = rng.random(rows) < MISSING_CENTROID_RATE
+
+    # Lognormal distances with a long tail, longer from the airports, and city traffic speeds
+    miles = rng.lognormal(np.log(2.5), 0.8, rows)
+    miles = np.where((centroid == 1) | (centroid == 2), miles + rng.gamma(4.0, 3.0, rows), miles).round(2)
+    seconds = np.maximum(60, miles / rng.uniform(10, 22, rows) * 3600 + rng.normal(120, 60, rows)).round(-1)
+    trip_end = (trip_start + pd.to_timedelta(seconds, unit="s")).floor("15min")
+
+    # The city's meter: a flag pull, a rate per mile and per minute
+    fare = (3.25 + 2.25 * miles + 0.2 * seconds / 60).round(2)
+    payment = rng.choice(len(PAYMENT_TYPES), rows, p=PAYMENT_WEIGHTS)
+    tips = (fare * np.array(TIP_RATES)[payment] * rng.uniform(0.5, 1.5, rows)).round(2)
+    extras = np.where(rng.random(rows) < 0.1, rng.choice([1.0, 2.0, 4.0], rows), 0.0)
+
+    trips = pd.DataFrame({
+        "Trip ID": [format(i, "040x") for i in range(offset, offset + rows)],
+        "Taxi ID": rng.zipf(1.5, rows).clip(max=5000).astype(str),
+        "Trip Start Timestamp": format_timestamps(trip_start),
+        "Trip End Timestamp": format_timestamps(trip_end),
+        "Trip Seconds": seconds,
+        "Trip Miles": miles,
+        "Fare": fare,
+        "Tips": tips,
+        "Trip Total": (fare + tips + extras).round(2),
+        "Payment Type": np.array(PAYMENT_TYPES)[payment],
+        "Company": np.array(COMPANIES)[rng.choice(len(COMPANIES), rows, p=COMPANY_WEIGHTS / COMPANY_WEIGHTS.sum())],
+        "Pickup Centroid Latitude": np.where(missing, np.nan, latitude[centroid]),
+        "Pickup Centroid Longitude": np.where(missing, np.nan, longitude[centroid]),
+    })
+
+    for column in ("Trip Seconds", "Trip Miles"):
+        trips.loc[rng.random(rows) < MISSING_METRIC_RATE, column] = np.nan
+
+    return trips
+
+def write_trips(path, rows, chunk_size=1_000_000, seed=0, **kwargs):
+    # Generated and appended a chunk at a time, so tens of millions of rows fit in the memory of one chunk
+    for offset in range(0, rows, chunk_size):
+        chunk = make_trips(min(chunk_size, rows - offset), seed=seed, offset=offset, **kwargs)
+        chunk.to_csv(path, mode="w" if offset == 0 else "a", header=offset == 0, index=False)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Writes synthetic Chicago taxi trips in the city's CSV schema")
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--chunk-size", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start", default="2024-01-01")
+    parser.add_argument("--days", type=int, default=60)
+    args = parser.parse_args()
+
+    write_trips(args.path, args.rows, args.chunk_size, args.seed, start=args.start, days=args.days)
+    print("{:,} trips, {:.1f} MiB".format(args.rows, os.path.getsize(args.path) / 2**20))
@@ -0,0 +1,153 @@
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+TIMESTAMP_FORMAT = "%m/%d/%Y %I:%M:%S %p"
+
+TIMESTAMP_COLUMNS = ["Trip Start Timestamp", "Trip End Timestamp"]
+
+CATEGORY_COLUMNS = ["Taxi ID", "Payment Type", "Company"] + TIMESTAMP_COLUMNS
+
+NUMERIC_DTYPES = {
+    "Trip Seconds": "float64",
+    "Trip Miles": "float64",
+    "Pickup Census Tract": "float64",
+    "Dropoff Census Tract": "float64",
+    "Pickup Community Area": "float64",
+    "Dropoff Community Area": "float64",
+    "Fare": "float64",
+    "Tips": "float64",
+    "Tolls": "float64",
+    "Extras": "float64",
+    "Trip Total": "float64",
+    "Pickup Centroid Latitude": "float64",
+    "Pickup Centroid Longitude": "float64",
+    "Dropoff Centroid Latitude": "float64",
+    "Dropoff Centroid Longitude": "float64",
+}
+
+# The CSV columns the dashboard reads, compact mode drops every other one
+COMPACT_COLUMNS = [
+    "Trip ID",
+    "Trip Start Timestamp",
+    "Trip Seconds",
+    "Trip Miles",
+    "Fare",
+    "Tips",
+    "Trip Total",
+    "Payment Type",
+    "Company",
+    "Pickup Centroid Latitude",
+    "Pickup Centroid Longitude",
+]
+
+# float32 keeps 7 significant digits: cents below $65,536, whole seconds below 194 days,
+# and centroids to under a meter, which is all these columns ever need
+COMPACT_DTYPES = {
+    "Trip ID": "string[pyarrow]",
+    "Trip Seconds": "float32",
+    "Trip Miles": "float32",
+    "Fare": "float32",
+    "Tips": "float32",
+    "Trip Total": "float32",
+    "latitude": "float32",
+    "longitude": "float32",
+}
+
+# The pickup centroids' CSV names and the names the dashboard uses
+CENTROID_COLUMNS = {"Pickup Centroid Latitude": "latitude", "Pickup Centroid Longitude": "longitude"}
+
+COMPANY_NAMES = {
+    "Taxicab Insurance Agency Llc": "Taxicab Insurance Agency, LLC",
+    "Choice Taxi Association Inc": "Choice Taxi Association",
+    "Blue Ribbon Taxi Association Inc.": "Blue Ribbon Taxi Association",
+    "Taxi Affiliation Services Llc - Yell": "Taxi Affiliation Services",
+}
+
+WEEKDAYS = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+
+PAYMENT_COLORS = {
+    "Cash": "#e81416",
+    "Credit Card": "#ffa500",
+    "Dispute": "#faeb36",
+    "Mobile": "#79c314",
+    "No Charge": "#487de7",
+    "Prcard": "#4b369d",
+    "Unknown": "#70369d",
+}
+
+WEEKDAY_COLORS = {
+    "Sunday": "#ff2b2b",
+    "Monday": "#092d52",
+    "Tuesday": "#29b09d",
+    "Wednesday": "#ffd16a",
+    "Thursday": "#7defa1",
+    "Friday": "#83c9ff",
+    "Saturday": "#ffabab",
+}
+
+def read_trips(source, chunk_size=None, compact=False):
+    # Trip IDs are hex, a block of them that happens to be all digits would otherwise be parsed as integers
+    dtypes = {"Trip ID": "str"}
+    dtypes.update(NUMERIC_DTYPES)
+    dtypes.update({column: "category" for column in CATEGORY_COLUMNS})
+    if compact:
+        # Parsed straight into the compact types, so the full-size columns never exist
+        names = {name: column for column, name in CENTROID_COLUMNS.items()}
+        dtypes.update({names.get(column, column): dtype for column, dtype in COMPACT_DTYPES.items()})
+
+    # With a chunk size this is an iterator of frames instead of one frame
+    return pd.read_csv(source, dtype=dtypes, usecols=COMPACT_COLUMNS if compact else None, chunksize=chunk_size)
+
+def parse_timestamps(timestamps):
+    # Trip timestamps are rounded to 15 minutes, so only the distinct values are parsed
+    parsed = pd.to_datetime(timestamps.cat.categories, format=TIMESTAMP_FORMAT)
+
+    return pd.Series(parsed.take(timestamps.cat.codes, allow_fill=True, fill_value=pd.NaT), index=timestamps.index, name=timestamps.name)
+
+def normalize_trips(data, compact=False):
+    data = data.rename(columns=CENTROID_COLUMNS)
+
+    # Mapping the categories merges the old company names into the current ones
+    data["Company"] = data["Company"].map(lambda company: COMPANY_NAMES.get(company, company), na_action="ignore").astype("category")
+
+    for column in TIMESTAMP_COLUMNS:
+        if column in data:
+            data[column] = parse_timestamps(data[column])
+
+    start = data["Trip Start Timestamp"]
+    data["Weekday"] = pd.Categorical(start.dt.day_name(), categories=WEEKDAYS)
+    if not compact:
+        data["Hour"] = start.dt.hour
+    data["Date"] = start.dt.normalize()
+
+    if compact:
+        data = data.astype(COMPACT_DTYPES)
+
+    # Kept sorted by start so date ranges can be sliced with a binary search
+    return data.sort_values("Trip Start Timestamp", kind="stable", ignore_index=True)
+
+def drop_corrections(data):
+    # Late corrections are appended as new rows with the trip's ID, its last row is the current version
+    return data.drop_duplicates("Trip ID", keep="last")
+
+def load_trips(source, compact=False):
+    return normalize_trips(drop_corrections(read_trips(source, compact=compact)), compact=compact)
+
+def bytes_per_row(data):
+    return data.memory_usage(deep=True).sum() / max(len(data), 1)
+
+def concat_frames(frames):
+    # Categoricals with different categories would be concatenated as strings, so the categories are unified first
+    dtypes = {}
+    for column, dtype in frames[0].dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype) and any(not frame[column].cat.categories.equals(dtype.categories) for frame in frames):
+            dtypes[column] = pd.CategoricalDtype(union_categoricals([frame[column] for frame in frames], sort_categories=True).categories)
+
+    return pd.concat([frame.astype(dtypes) for frame in frames], ignore_index=True)
+
+def filter_date_range(data, start_date, end_date, column="Trip Start Timestamp"):
+    start = data[column]
+    first = start.searchsorted(pd.Timestamp(start_date), side="left")
+    last = start.searchsorted(pd.Timestamp(end_date) + pd.Timedelta(days=1), side="left")
+
+    return data.iloc[first:last]